@@ -1,22 +1,61 @@
+import asyncio
 import os
+from typing import AsyncIterator, List, Optional, Tuple
 import google.generativeai as genai
-from dotenv import load_dotenv
+from pydantic import TypeAdapter, ValidationError
+from agents.llm_client import LLMClient, get_llm_client
+from agents.model_pool import ModelPool, configure_genai
+from agents.prompt_builder import WINDOWED_NOTE, compact_json, estimate_tokens, fit_performance_context, fit_transcript, record_prompt_size, token_budget
+from tools.compliance_scanner import scan_transcript
+from tools.finance_tools import mentions_rates_or_payments, rate_cache
+from tools.instrumentation import record_llm_call, registry
+from tools.models import CONTENT_METRICS_RESPONSE_SCHEMA, CombinedReview
+
+COMBINED_REVIEW_ADAPTER = TypeAdapter(CombinedReview)
+
+COMBINED_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {
+            "content_analysis": CONTENT_METRICS_RESPONSE_SCHEMA,
+            "strategic_review": {"type": "string"},
+        },
+        "required": ["content_analysis", "strategic_review"],
+    },
+}
+
+RCA_ERROR_PREFIX = "RCA Error during synthesis:"
+
+
+def is_review_error(review: Optional[str]) -> bool:
+    """True for the fallback text review()/review_async() return when synthesis failed."""
+    return review is not None and review.startswith(RCA_ERROR_PREFIX)
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 class ReviewCoordinatorAgent:
-    def __init__(self):
+    def __init__(self, llm: Optional[LLMClient] = None):
+        configure_genai()
+        # Rate limiting, retries and circuit breaking shared with the analyzer
+        self.llm = llm if llm is not None else get_llm_client()
         # Base model initialized without instruction (it's dynamic)
         self.model = genai.GenerativeModel(
             model_name='gemini-2.5-pro'
         )
+        # One model per policy + persona instruction, reused across requests
+        self.model_pool = ModelPool(
+            model_name=self.model.model_name,
+            max_size=int(os.getenv("MODEL_POOL_SIZE", "32"))
+        )
+        # Fast mode: one flash call produces both the ContentMetrics JSON and the review
+        self.fast_model_pool = ModelPool(
+            model_name=os.getenv("FAST_MODE_MODEL", "gemini-2.5-flash"),
+            max_size=int(os.getenv("MODEL_POOL_SIZE", "32"))
+        )
 
-    def review(self, content_data: dict, performance_data: dict, policy_data: dict, influencer_data: dict) -> str:
-        """Receives all context data and synthesizes the strategic review."""
-        
+    def _system_instruction(self, policy_data: dict, influencer_data: dict) -> str:
         # 1. Construct the Comprehensive System Instruction
-        system_instruction = f"""
+        return f"""
         You are the Lead Performance Strategist. Your goal is multivariate attribution: finding if performance was due to the Market, the Message, or the Messenger.
         
         CORE PHILOSOPHY: Market Rates are the primary driver of Lead Performance, serving as the Contextual Lens (Headwind/Tailwind).
@@ -32,25 +71,129 @@ class ReviewCoordinatorAgent:
         3. Correlate Performance: Weigh the Lead Volume (North Star) against the Market Context. Use the 'Steady Hand' protocol (Low volume in Headwind = Acceptable, No Change needed).
         4. Strategy Generation: Provide actionable recommendations (copy changes, scaling, or maintenance).
         """
+
+    def _build_request(self, content_data: dict, performance_data: dict, policy_data: dict, influencer_data: dict) -> Tuple[genai.GenerativeModel, str]:
+        """Returns the pooled model for this policy/persona and the prompt to send it."""
+        system_instruction = self._system_instruction(policy_data, influencer_data)
         
+        # CRITICAL FIX: The instruction must be a top-level constructor argument, so models
+        # are built once per distinct instruction and reused from the pool.
+        model_with_instruction = self.model_pool.get(system_instruction)
+        
+        # Compact JSON instead of dict reprs; a long grouped breakdown is trimmed to fit the budget
+        content_json = compact_json(content_data)
+        performance_budget = token_budget(self.model.model_name) - estimate_tokens(system_instruction) - estimate_tokens(content_json)
+        performance_json = compact_json(fit_performance_context(performance_data, max(performance_budget, 512)))
+        
+        prompt = f"""
+        Content Analysis (Quality/Compliance): {content_json}
+        Performance Metrics (Volume/Quality): {performance_json}
+        
+        Provide a final Strategic Review.
+        """
+        record_prompt_size("coordinator", system_instruction, prompt)
+        return model_with_instruction, prompt
+
+    def review(self, content_data: dict, performance_data: dict, policy_data: dict, influencer_data: dict) -> str:
+        """Receives all context data and synthesizes the strategic review."""
         try:
-            # CRITICAL FIX: Dynamically create a new model instance with the instruction 
-            # as a top-level argument, which satisfies the SDK syntax requirement.
-            model_with_instruction = genai.GenerativeModel(
-                model_name=self.model.model_name,
-                system_instruction=system_instruction
-            )
+            model_with_instruction, prompt = self._build_request(content_data, performance_data, policy_data, influencer_data)
+            response = self.llm.call(self.model.model_name, lambda: model_with_instruction.generate_content(prompt))
+            record_llm_call(self.model.model_name, response)
+            return response.text
             
-            prompt = f"""
-            Content Analysis (Quality/Compliance): {content_data}
-            Performance Metrics (Volume/Quality): {performance_data}
+        except Exception as e:
+            record_llm_call(self.model.model_name, outcome="error")
+            return f"{RCA_ERROR_PREFIX} {e}"
+
+    async def review_async(self, content_data: dict, performance_data: dict, policy_data: dict, influencer_data: dict) -> str:
+        """Same as review(), using the SDK's async generation API."""
+        try:
+            model_with_instruction, prompt = self._build_request(content_data, performance_data, policy_data, influencer_data)
+            response = await self.llm.call_async(self.model.model_name, lambda: model_with_instruction.generate_content_async(prompt))
+            record_llm_call(self.model.model_name, response)
+            return response.text
             
-            Provide a final Strategic Review.
-            """
+        except Exception as e:
+            record_llm_call(self.model.model_name, outcome="error")
+            return f"{RCA_ERROR_PREFIX} {e}"
+
+    async def review_stream_async(self, content_data: dict, performance_data: dict, policy_data: dict, influencer_data: dict) -> AsyncIterator[str]:
+        """Same as review_async(), yielding the review text chunk by chunk as the model generates it."""
+        model_with_instruction, prompt = self._build_request(content_data, performance_data, policy_data, influencer_data)
+        try:
+            # Admission and retries cover opening the stream; chunks already forwarded can't be replayed
+            response = await self.llm.call_async(
+                self.model.model_name,
+                lambda: model_with_instruction.generate_content_async(prompt, stream=True)
+            )
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception:
+            record_llm_call(self.model.model_name, outcome="error")
+            raise
+        # Usage metadata is only complete once the stream has been consumed
+        record_llm_call(self.model.model_name, response)
+
+    async def combined_review_async(self, approved_script: str, influencer_transcript: str, compliance_phrases: List[str], forbidden_topics: List[str], performance_data: dict, policy_data: dict, influencer_data: dict) -> Optional[CombinedReview]:
+        """
+        Fast mode: content analysis and strategic review in a single structured generation.
+        Returns None if the call fails or the output doesn't validate, so the caller can fall
+        back to the two-stage path.
+        """
+        system_instruction = self._system_instruction(policy_data, influencer_data) + f"""
+        CONTENT AUDIT (performed in the same pass):
+        - Compare the APPROVED SCRIPT (The Plan) against the INFLUENCER TRANSCRIPT (The Reality) for semantic fidelity.
+        - MANDATORY COMPLIANCE PHRASES: {compact_json(compliance_phrases)}
+        - FORBIDDEN TOPICS (Risk Check - List specific violation sentences): {compact_json(forbidden_topics)}
+        
+        OUTPUT: A single JSON object with exactly two keys:
+        - "content_analysis": an object matching the ContentMetrics schema (tone_score, hook_strength, key_themes, rate_check, deviation_summary)
+        - "strategic_review": the final Strategic Review as a string
+        """
+        rate_context = ""
+        if mentions_rates_or_payments(approved_script, influencer_transcript):
+            # No tools in this mode, so the cached market rate is provided directly; without
+            # one the model just works from the transcript
+            try:
+                rate = await asyncio.to_thread(rate_cache.get, '30_year_fixed')
+                rate_context = f"\n        CURRENT MARKET RATE: {compact_json(rate)}\n"
+            except Exception as e:
+                print(f"   [FAST] ⚠️  Rate lookup failed, omitting the market rate: {e}")
+        
+        try:
+            model = self.fast_model_pool.get(system_instruction)
+            performance_json = compact_json(fit_performance_context(performance_data, token_budget(self.fast_model_pool.model_name) // 4))
+            transcript_text, windowed = fit_transcript(
+                influencer_transcript, self.fast_model_pool.model_name,
+                (system_instruction, approved_script, performance_json, rate_context),
+                scan=scan_transcript(influencer_transcript, compliance_phrases, forbidden_topics),
+                approved_script=approved_script, forbidden_topics=forbidden_topics
+            )
             
-            # Call generate_content on the new model instance
-            response = model_with_instruction.generate_content(prompt)
-            return response.text
+            prompt = f"""
+        A) Approved Script (PLAN): "{approved_script}"
+        B) Influencer Transcript (REALITY): "{transcript_text}"
+        {WINDOWED_NOTE if windowed else ""}
+        Performance Metrics (Volume/Quality): {performance_json}
+        
+        Return ONLY the JSON object.
+        """ + rate_context
+            record_prompt_size("fast", system_instruction, prompt)
             
+            response = await self.llm.call_async(
+                self.fast_model_pool.model_name,
+                lambda: model.generate_content_async(prompt, generation_config=COMBINED_GENERATION_CONFIG)
+            )
+            record_llm_call(self.fast_model_pool.model_name, response)
+            clean_text = response.text.replace("```json", "").replace("```", "").strip()
+            return COMBINED_REVIEW_ADAPTER.validate_json(clean_text)
+        except ValidationError as e:
+            registry.inc("fast_mode_validation_failures_total")
+            print(f"   [FAST] ⚠️  Combined output failed validation: {e.error_count()} error(s)")
+            return None
         except Exception as e:
-            return f"RCA Error during synthesis: {e}"
\ No newline at end of file
+            record_llm_call(self.fast_model_pool.model_name, outcome="error")
+            print(f"   [FAST] ⚠️  Combined call failed: {e}")
+            return None
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from tools.instrumentation import registry
+from tools.loop_local import LoopLocal
+
+try:
+    from google.api_core import exceptions as api_exceptions
+    _RETRYABLE_TYPES: Tuple[type, ...] = (
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded,
+    )
+    _QUOTA_TYPES: Tuple[type, ...] = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)
+except ImportError:
+    _RETRYABLE_TYPES, _QUOTA_TYPES = (), ()
+
+T = TypeVar("T")
+
+registry.describe("llm_ratelimit_decisions_total", "Admission decisions of the per-model token bucket (admitted, delayed, rejected).")
+registry.describe("llm_retries_total", "Retried model calls by model and reason.")
+registry.describe("llm_circuit_rejections_total", "Calls failed fast because the model's circuit was open.")
+
+
+class RateLimitedError(RuntimeError):
+    """The call would have queued longer than LLM_MAX_QUEUE_SECONDS behind the model's rate limit."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The model's circuit breaker is open after repeated failures; the call was not sent."""
+
+
+def is_quota_error(e: Exception) -> bool:
+    if _QUOTA_TYPES and isinstance(e, _QUOTA_TYPES):
+        return True
+    text = str(e).lower()
+    return "429" in text or "quota" in text or "resource exhausted" in text
+
+
+def is_retryable(e: Exception) -> bool:
+    """Quota, overload and transient transport errors; anything else (bad request, safety block) is final."""
+    if _RETRYABLE_TYPES and isinstance(e, _RETRYABLE_TYPES):
+        return True
+    if isinstance(e, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    text = str(e).lower()
+    return is_quota_error(e) or any(s in text for s in ("500", "503", "504", "unavailable", "deadline exceeded"))
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to the quota actually available (AIMD): a quota
+    error halves the rate, each success creeps it back towards the configured ceiling.
+    Callers reserve a token and wait out the returned delay, so queued calls leave in order.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: float):
+        self.max_rate = rate_per_sec
+        self.min_rate = max(rate_per_sec / 20, 0.05)
+        self.rate = rate_per_sec
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Seconds to wait before sending, or None if that would exceed max_wait (nothing reserved)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            delay = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if delay > max_wait:
+                return None
+            self._tokens -= 1
+            return delay
+
+    def penalize(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive retryable failures and rejects calls for
+    `reset_seconds`; then lets a single trial call through (half-open) to decide whether to close.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """An admitted call was never sent (e.g. rate-limited): the next call may be the trial instead."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """
+        An admitted call ended without an outcome (cancelled). A pending half-open trial counts as
+        failed, so the breaker re-opens instead of waiting forever on a trial that will never report.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._trial_in_flight:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class _ModelGuard:
+    """Bucket (None without an rpm limit), breaker and in-flight caps for one model name."""
+
+    def __init__(self, rpm: Optional[float], concurrency: int, breaker_failures: int, breaker_reset: float):
+        self.bucket = AdaptiveTokenBucket(rpm / 60.0, burst=max(1.0, min(rpm / 60.0 * 2, concurrency))) if rpm else None
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self.concurrency = concurrency
+        self.sync_slots = threading.BoundedSemaphore(concurrency)
+        self.in_flight = 0
+        # asyncio semaphores belong to one event loop; keep one per loop (the benchmarks run several)
+        self._async_slots = LoopLocal(lambda: asyncio.Semaphore(concurrency))
+
+    def async_slots(self) -> asyncio.Semaphore:
+        return self._async_slots.get()
+
+
+class LLMClient:
+    """
+    Shared call layer for every Gemini request: per-model adaptive token bucket, concurrency cap,
+    circuit breaker, and retries with full-jitter exponential backoff on retryable errors.
+
+    Agents pass a zero-argument callable that performs one attempt; it is re-invoked on retry,
+    so it should build any per-attempt state (e.g. a fresh chat session) itself.
+    """
+
+    def __init__(
+        self,
+        default_rpm: Optional[float] = None,
+        default_concurrency: int = 16,
+        model_limits: Optional[Dict[str, dict]] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_queue_seconds: float = 30.0,
+        breaker_failures: int = 5,
+        breaker_reset_seconds: float = 30.0,
+    ):
+        self.default_rpm = default_rpm
+        self.default_concurrency = default_concurrency
+        self.model_limits = model_limits or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_queue_seconds = max_queue_seconds
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._guards: Dict[str, _ModelGuard] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        """
+        LLM_DEFAULT_RPM / LLM_DEFAULT_CONCURRENCY apply to every model; LLM_MODEL_LIMITS is JSON
+        overriding them per model, e.g. {"gemini-2.5-pro": {"rpm": 150, "concurrency": 8}}.
+        Without an rpm (unset or 0) a model has no client-side rate limit: its quota errors
+        are still retried, and the concurrency cap still applies.
+        """
+        default_rpm = os.getenv("LLM_DEFAULT_RPM")
+        return cls(
+            default_rpm=float(default_rpm) if default_rpm else None,
+            default_concurrency=int(os.getenv("LLM_DEFAULT_CONCURRENCY", "16")),
+            model_limits=json.loads(os.getenv("LLM_MODEL_LIMITS", "{}")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8")),
+            max_queue_seconds=float(os.getenv("LLM_MAX_QUEUE_SECONDS", "30")),
+            breaker_failures=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            breaker_reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+        )
+
+    def _guard(self, model_name: str) -> _ModelGuard:
+        with self._lock:
+            guard = self._guards.get(model_name)
+            if guard is None:
+                limits = self.model_limits.get(model_name, {})
+                guard = self._guards[model_name] = _ModelGuard(
+                    rpm=limits.get("rpm", self.default_rpm),
+                    concurrency=int(limits.get("concurrency", self.default_concurrency)),
+                    breaker_failures=self.breaker_failures,
+                    breaker_reset=self.breaker_reset_seconds,
+                )
+            return guard
+
+    def _admit(self, model_name: str, guard: _ModelGuard) -> float:
+        """Breaker check plus token reservation; returns how long to wait before sending."""
+        # Breaker first, so the calls it rejects don't consume rate-limit tokens
+        if not guard.breaker.allow():
+            registry.inc("llm_circuit_rejections_total", model=model_name)
+            raise CircuitOpenError(f"Circuit open for {model_name} after repeated failures; retry later.")
+        if guard.bucket is None:
+            registry.inc("llm_ratelimit_decisions_total", model=model_name, decision="admitted")
+            return 0.0
+        delay = guard.bucket.reserve(self.max_queue_seconds)
+        if delay is None:
+            # Not sent, so it can't be the half-open trial
+            guard.breaker.release_trial()
+            registry.inc("llm_ratelimit_decisions_total", model=model_name, decision="rejected")
+            raise RateLimitedError(f"{model_name} is over its rate limit (queue > {self.max_queue_seconds}s).")
+        registry.inc("llm_ratelimit_decisions_total", model=model_name, decision="delayed" if delay else "admitted")
+        if delay:
+            registry.observe("llm_ratelimit_wait_seconds", delay, model=model_name)
+        return delay
+
+    def _on_failure(self, model_name: str, guard: _ModelGuard, e: Exception, attempt: int) -> Optional[float]:
+        """Updates breaker/bucket state; returns the backoff before the next attempt, or None to give up."""
+        if not is_retryable(e):
+            # The model answered (bad request, safety block...): not a sign of overload
+            guard.breaker.record_success()
+            return None
+        guard.breaker.record_failure()
+        quota = is_quota_error(e)
+        if quota and guard.bucket is not None:
+            guard.bucket.penalize()
+        if attempt >= self.max_retries or guard.breaker.state == CircuitBreaker.OPEN:
+            return None
+        registry.inc("llm_retries_total", model=model_name, reason="quota" if quota else "transient")
+        # Full jitter: spreads retries out so a burst of failures doesn't come back as a burst
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _on_success(self, guard: _ModelGuard) -> None:
+        guard.breaker.record_success()
+        if guard.bucket is not None:
+            guard.bucket.reward()
+
+    async def call_async(self, model_name: str, attempt_fn: Callable[[], Awaitable[T]]) -> T:
+        guard = self._guard(model_name)
+        attempt = 0
+        while True:
+            delay = self._admit(model_name, guard)
+            try:
+                if delay:
+                    await asyncio.sleep(delay)
+                async with guard.async_slots():
+                    guard.in_flight += 1
+                    try:
+                        result = await attempt_fn()
+                    finally:
+                        guard.in_flight -= 1
+            except Exception as e:
+                backoff = self._on_failure(model_name, guard, e, attempt)
+                if backoff is None:
+                    raise
+                print(f"   [LLM] 🔁 {model_name} call failed ({e}); retrying in {backoff:.2f}s.")
+                await asyncio.sleep(backoff)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (client disconnect, closed SSE stream, hedge cancel): never leave a trial dangling
+                guard.breaker.record_abandoned()
+                raise
+            self._on_success(guard)
+            return result
+
+    def call(self, model_name: str, attempt_fn: Callable[[], T]) -> T:
+        """Blocking variant of call_async() for the synchronous agent methods."""
+        guard = self._guard(model_name)
+        attempt = 0
+        while True:
+            delay = self._admit(model_name, guard)
+            try:
+                if delay:
+                    time.sleep(delay)
+                with guard.sync_slots:
+                    guard.in_flight += 1
+                    try:
+                        result = attempt_fn()
+                    finally:
+                        guard.in_flight -= 1
+            except Exception as e:
+                backoff = self._on_failure(model_name, guard, e, attempt)
+                if backoff is None:
+                    raise
+                print(f"   [LLM] 🔁 {model_name} call failed ({e}); retrying in {backoff:.2f}s.")
+                time.sleep(backoff)
+                attempt += 1
+                continue
+            except BaseException:
+                guard.breaker.record_abandoned()
+                raise
+            self._on_success(guard)
+            return result
+
+    def collect(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Gauge samples for /metrics: current adaptive rate, in-flight calls and breaker state."""
+        with self._lock:
+            guards = list(self._guards.items())
+        samples = []
+        for model_name, guard in guards:
+            labels = {"model": model_name}
+            if guard.bucket is not None:
+                samples.append(("llm_ratelimit_rate_per_second", labels, round(guard.bucket.rate, 4)))
+            samples.append(("llm_in_flight", labels, guard.in_flight))
+            samples.append(("llm_concurrency_limit", labels, guard.concurrency))
+            samples.append(("llm_circuit_open", labels, 0 if guard.breaker.state == CircuitBreaker.CLOSED else 1))
+        return samples
+
+
+_shared: Optional[LLMClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """The process-wide client, built on first use (after .env has been loaded) and exported to /metrics."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LLMClient.from_env()
+            registry.register_collector(_shared.collect)
+        return _shared
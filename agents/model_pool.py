@@ -0,0 +1,69 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_genai() -> None:
+    """Loads .env and configures the SDK once per process, on first agent construction rather than at import."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        load_dotenv()
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        _configured = True
+
+
+class ModelPool:
+    """
+    Bounded LRU of GenerativeModel instances, one per distinct system instruction.
+
+    The SDK only accepts system_instruction at construction time, so without a pool
+    every request builds a fresh model. Keys default to the instruction text itself,
+    which stays correct when a policy is edited in place (same policy_id, new rules).
+    """
+
+    def __init__(self, model_name: str, tools: Optional[List[Callable]] = None, max_size: int = 32):
+        self.model_name = model_name
+        self.tools = tools
+        self.max_size = max_size
+        self._models: "OrderedDict[str, genai.GenerativeModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get(self, system_instruction: str, key: Optional[str] = None) -> genai.GenerativeModel:
+        pool_key = key if key is not None else system_instruction
+        with self._lock:
+            model = self._models.get(pool_key)
+            if model is not None:
+                self._models.move_to_end(pool_key)
+                self.reused += 1
+                return model
+
+        model = genai.GenerativeModel(
+            model_name=self.model_name,
+            tools=self.tools,
+            system_instruction=system_instruction
+        )
+
+        with self._lock:
+            # Another thread may have raced us here; keep whichever landed first
+            existing = self._models.get(pool_key)
+            if existing is not None:
+                self.reused += 1
+                return existing
+            self._models[pool_key] = model
+            self.created += 1
+            while len(self._models) > self.max_size:
+                self._models.popitem(last=False)
+        return model
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "size": len(self._models), "created": self.created, "reused": self.reused}
@@ -0,0 +1,199 @@
+import json
+import math
+import os
+import re
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from tools.instrumentation import registry
+from tools.models import ComplianceScan
+
+# Rough chars-per-token for Gemini on English text; good enough to budget before sending.
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "16000"))
+# Per-model overrides, e.g. {"gemini-2.5-pro": 12000, "gemini-2.5-flash": 32000}
+MODEL_TOKEN_BUDGETS: Dict[str, int] = json.loads(os.getenv("PROMPT_TOKEN_BUDGETS", "{}"))
+# Sentences always kept from the start of a windowed transcript (the hook is judged on them)
+OPENING_SENTENCES = int(os.getenv("PROMPT_OPENING_SENTENCES", "3"))
+
+GAP_MARKER = "[...]"
+# Unpunctuated speech-to-text output is split into pseudo-sentences of about this size
+MAX_SPAN_CHARS = 400
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?]*\n*")
+_WORD_RE = re.compile(r"[^\W_]+")
+# Words too common to say anything about relevance
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its me my of on or our so that the "
+    "their them they this to was we were what when which who will with you your".split()
+)
+
+registry.describe("prompt_tokens_estimated_total", "Estimated prompt tokens per agent, counted before sending.")
+registry.describe("prompt_transcripts_windowed_total", "Transcripts cut down to their relevant windows to fit the token budget.")
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate (no API round trip), used to budget prompts up front."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def token_budget(model_name: str) -> int:
+    return int(MODEL_TOKEN_BUDGETS.get(model_name, DEFAULT_TOKEN_BUDGET))
+
+
+def compact_json(obj: Any) -> str:
+    """Minified JSON with None fields dropped: far fewer tokens than a dict repr, and unambiguous."""
+    return json.dumps(_drop_none(obj), separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+
+def _json_default(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    return str(obj)
+
+
+def _drop_none(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _drop_none(v) for k, v in obj.items() if v is not None}
+    if isinstance(obj, (list, tuple)):
+        return [_drop_none(v) for v in obj]
+    return obj
+
+
+def _content_words(text: str) -> Set[str]:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS and len(w) > 2}
+
+
+def _sentences(text: str) -> List[Tuple[int, int]]:
+    spans = []
+    for m in _SENTENCE_RE.finditer(text):
+        if not m.group().strip():
+            continue
+        start, end = m.start(), m.end()
+        while end - start > MAX_SPAN_CHARS:
+            cut = text.rfind(" ", start, start + MAX_SPAN_CHARS)
+            cut = cut if cut > start else start + MAX_SPAN_CHARS
+            spans.append((start, cut))
+            start = cut
+        spans.append((start, end))
+    return spans
+
+
+def window_transcript(
+    transcript: str,
+    budget_tokens: int,
+    scan: Optional[ComplianceScan] = None,
+    approved_script: str = "",
+    forbidden_topics: Iterable[str] = (),
+    context_sentences: int = 1,
+) -> Tuple[str, bool]:
+    """
+    Returns (text, windowed). Transcripts within budget are returned unchanged. Longer ones are
+    cut down to the passages the audit needs, kept in original order with GAP_MARKER between them:
+
+    1. the opening sentences (hook strength),
+    2. sentences containing compliance-phrase matches and forbidden-topic hits from the scan,
+       plus `context_sentences` either side,
+    3. then, best first, sentences sharing vocabulary with forbidden topics (they're checked
+       fuzzily, not only verbatim) or with the approved script, until the budget is spent.
+    """
+    if estimate_tokens(transcript) <= budget_tokens:
+        return transcript, False
+
+    spans = _sentences(transcript)
+    if not spans:
+        return transcript[: int(budget_tokens * CHARS_PER_TOKEN)], True
+
+    starts = [start for start, _ in spans]
+
+    def index_of(offset: int) -> int:
+        return max(0, bisect_right(starts, offset) - 1)
+
+    must: Set[int] = set(range(min(OPENING_SENTENCES, len(spans))))
+    if scan is not None:
+        for hit in [*scan.matched_phrases, *scan.forbidden_hits]:
+            i = index_of(hit.start)
+            must.update(range(max(0, i - context_sentences), min(len(spans), i + context_sentences + 1)))
+
+    # Relevance of every other sentence: forbidden-topic vocabulary counts double
+    forbidden_words = set().union(*(_content_words(t) for t in forbidden_topics)) if forbidden_topics else set()
+    script_words = _content_words(approved_script)
+    scored = []
+    for i, (start, end) in enumerate(spans):
+        if i in must:
+            continue
+        words = _content_words(transcript[start:end])
+        score = 2 * len(words & forbidden_words) + len(words & script_words)
+        if score:
+            scored.append((score, i))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+
+    chosen: Set[int] = set()
+    used = 0
+    for i in sorted(must):
+        # +1 covers the joining space / gap marker
+        cost = estimate_tokens(transcript[spans[i][0]:spans[i][1]]) + 1
+        if used + cost > budget_tokens:
+            break
+        chosen.add(i)
+        used += cost
+    for _, i in scored:
+        # +1 covers the joining space / gap marker
+        cost = estimate_tokens(transcript[spans[i][0]:spans[i][1]]) + 1
+        if used + cost > budget_tokens:
+            continue
+        chosen.add(i)
+        used += cost
+
+    parts, previous = [], -1
+    for i in sorted(chosen):
+        if i != previous + 1:
+            parts.append(GAP_MARKER)
+        parts.append(transcript[spans[i][0]:spans[i][1]].strip())
+        previous = i
+    if previous != len(spans) - 1:
+        parts.append(GAP_MARKER)
+    registry.inc("prompt_transcripts_windowed_total")
+    return " ".join(parts), True
+
+
+def fit_transcript(transcript: str, model_name: str, fixed_parts: Iterable[str], scan: Optional[ComplianceScan] = None, approved_script: str = "", forbidden_topics: Iterable[str] = ()) -> Tuple[str, bool]:
+    """window_transcript() with whatever the model's budget leaves after the rest of the prompt."""
+    remaining = token_budget(model_name) - sum(estimate_tokens(p) for p in fixed_parts)
+    # Never squeeze the transcript below a usable floor, even if the instruction alone is large
+    return window_transcript(transcript, max(remaining, 512), scan, approved_script, forbidden_topics)
+
+
+WINDOWED_NOTE = (
+    "NOTE: The transcript was too long to send in full. It has been cut to the opening and the "
+    f"passages relevant to the compliance phrases, forbidden topics and approved script; {GAP_MARKER} marks omitted text."
+)
+
+
+def fit_performance_context(performance: dict, budget_tokens: int) -> dict:
+    """
+    Keeps the coordinator's performance context within budget. Only the grouped breakdown can
+    grow without bound, so it is cut to its most recent groups (keys are sorted) until it fits.
+    """
+    breakdown = performance.get("breakdown")
+    if not breakdown or estimate_tokens(compact_json(performance)) <= budget_tokens:
+        return performance
+    columns = [k for k, v in breakdown.items() if isinstance(v, list)]
+    total = len(breakdown.get("keys", []))
+    keep = total
+    trimmed = dict(performance)
+    while keep > 1:
+        keep //= 2
+        trimmed["breakdown"] = {
+            **{k: v for k, v in breakdown.items() if k not in columns},
+            **{k: breakdown[k][-keep:] for k in columns},
+            "groups_omitted": total - keep,
+        }
+        if estimate_tokens(compact_json(trimmed)) <= budget_tokens:
+            break
+    return trimmed
+
+
+def record_prompt_size(agent: str, *parts: str) -> int:
+    tokens = sum(estimate_tokens(p) for p in parts)
+    registry.inc("prompt_tokens_estimated_total", tokens, agent=agent)
+    return tokens
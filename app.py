@@ -2,10 +2,17 @@ import asyncio
 import os
 import io
 import json
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, ValidationError
 # Removed unnecessary starlette import
-from main_graph import run_agent_system 
+from main_graph import get_runtime, run_agent_system, run_agent_system_batch, run_agent_system_stream, runtime_initialized, shutdown_runtime
+from tools.instrumentation import registry
+from tools.metrics_engine import SMALL_CSV_BYTES
 from tools.models import AgentState, InfluencerProfile 
 
 # --- SERVICE ACCOUNT SETUP (for Sheets integration) ---
@@ -26,7 +33,30 @@ class AnalyzeRequestSchema(BaseModel):
 # --- 2. INITIALIZE APP ---
 is_prod = os.getenv("ENV") == "production"
 
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() not in ("0", "false", "no")
+
+def _log_warmup_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print(f"   [WARMUP] ❌ Warmup task failed: {task.exception()}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Agents are built here (off the event loop) instead of at import time; the warmup
+    # runs in the background so the server starts listening right away and /ready
+    # flips once it's done.
+    await asyncio.to_thread(get_runtime)
+    warmup_task = None
+    if WARMUP_ON_STARTUP:
+        # Runtime.warmup() catches its own failures; the callback logs anything that still escapes
+        warmup_task = asyncio.create_task(asyncio.to_thread(get_runtime().warmup))
+        warmup_task.add_done_callback(_log_warmup_failure)
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await asyncio.to_thread(shutdown_runtime)
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Influencer Review Agent API (Phase 2)",
     version="1.1.0",
     description="Multi-Agent System with File Upload and Sheets Integration.",
@@ -45,15 +75,26 @@ async def analyze_campaign_live(
     approved_script: str = Form(..., description="The approved marketing copy."),
     influencer_transcript: str = Form(..., description="The actual video transcript."),
     campaign_date: str = Form(..., description="The date the campaign ran (YYYY-MM-DD)."),
-    influencer_profile: str = Form(..., description="Influencer details (JSON string).")
+    influencer_profile: str = Form(..., description="Influencer details (JSON string)."),
+    group_by: Optional[str] = Form(None, description="Optional CSV column for a per-group breakdown (e.g. Date, Influencer ID)."),
+    reuse_stored: Optional[bool] = Form(None, description="Serve an earlier identical run from the results store if one exists."),
+    mode: Optional[str] = Form(None, description="'standard' (two model calls) or 'fast' (single combined call)."),
+    speculative: bool = Form(False, description="Fast mode: start the two-stage analyzer in parallel as a ready fallback."),
+    brand: Optional[str] = Form(None, description="Brand whose policy history applies (omit for unbranded policies).")
 ):
     """
     Triggers the Async 4-Gear Attribution Workflow using a file upload.
     """
     try:
-        # 3a. Read and decode the CSV file contents
-        file_contents = await csv_file.read()
-        csv_data = file_contents.decode("utf-8")
+        # 3a. Small CSVs are decoded in full as before; large exports are streamed in
+        # chunks by the metrics engine and never held in memory as one string.
+        csv_stream = None
+        if csv_file.size is not None and csv_file.size <= SMALL_CSV_BYTES:
+            file_contents = await csv_file.read()
+            csv_data = file_contents.decode("utf-8")
+        else:
+            csv_data = ""
+            csv_stream = csv_file.file
         
         # 3b. Parse the JSON strings from Form data
         try:
@@ -69,6 +110,12 @@ async def analyze_campaign_live(
             csv_data,
             campaign_date,
             profile_data,
+            csv_stream=csv_stream,
+            group_by=group_by,
+            reuse_stored=reuse_stored,
+            mode=mode,
+            speculative=speculative,
+            brand=brand,
         )
         
         if result_state.errors:
@@ -82,8 +129,188 @@ async def analyze_campaign_live(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+# --- 3a. STREAMING ENDPOINT ---
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/analyze_stream")
+async def analyze_campaign_stream(
+    csv_file: UploadFile = File(..., description="Lead Performance Data (CSV file)"),
+    approved_script: str = Form(..., description="The approved marketing copy."),
+    influencer_transcript: str = Form(..., description="The actual video transcript."),
+    campaign_date: str = Form(..., description="The date the campaign ran (YYYY-MM-DD)."),
+    influencer_profile: str = Form(..., description="Influencer details (JSON string)."),
+    group_by: Optional[str] = Form(None, description="Optional CSV column for a per-group breakdown (e.g. Date, Influencer ID)."),
+    brand: Optional[str] = Form(None, description="Brand whose policy history applies (omit for unbranded policies).")
+):
+    """
+    Same workflow as /analyze_live, as server-sent events: 'policy', 'metrics' and
+    'content_analysis' as each stage finishes, 'review_delta' chunks while the coordinator
+    writes, then 'done' with the full AgentState ('error' events report failures).
+    """
+    try:
+        profile_data = json.loads(influencer_profile)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON format in 'influencer_profile' field.")
+
+    csv_stream = None
+    if csv_file.size is not None and csv_file.size <= SMALL_CSV_BYTES:
+        csv_data = (await csv_file.read()).decode("utf-8")
+    else:
+        # The upload may be closed once this handler returns, before the stream is consumed,
+        # so large files are copied into a spool owned by the generator below
+        csv_data = ""
+        csv_stream = tempfile.SpooledTemporaryFile(max_size=SMALL_CSV_BYTES)
+        await asyncio.to_thread(shutil.copyfileobj, csv_file.file, csv_stream)
+        csv_stream.seek(0)
+
+    async def events():
+        try:
+            async for event, payload in run_agent_system_stream(
+                approved_script,
+                influencer_transcript,
+                csv_data,
+                campaign_date,
+                profile_data,
+                csv_stream=csv_stream,
+                group_by=group_by,
+                brand=brand,
+            ):
+                yield _sse(event, payload)
+        finally:
+            if csv_stream is not None:
+                csv_stream.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies (Cloud Run's front end included) must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- 3b. BATCH ENDPOINT ---
+BATCH_REQUIRED_FIELDS = ("approved_script", "influencer_transcript", "campaign_date", "influencer_profile")
+
+async def _parse_batch_manifest(manifest: bytes, csv_files: dict) -> list:
+    """
+    One campaign per JSONL line. CSV data is either inline ('csv_data') or a reference
+    ('csv_file') to one of the uploaded files; each referenced file is decoded once.
+    """
+    decoded_csvs = {}
+    campaigns = []
+    for line_no, line in enumerate(manifest.decode("utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            campaign = json.loads(line)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON on line {line_no} of the campaign manifest.")
+        missing = [f for f in BATCH_REQUIRED_FIELDS if f not in campaign]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Line {line_no} is missing fields: {missing}")
+        if isinstance(campaign["influencer_profile"], str):
+            try:
+                campaign["influencer_profile"] = json.loads(campaign["influencer_profile"])
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON in 'influencer_profile' on line {line_no}.")
+        if "csv_data" not in campaign:
+            name = campaign.get("csv_file")
+            if name not in csv_files:
+                raise HTTPException(status_code=400, detail=f"Line {line_no} needs 'csv_data' or a 'csv_file' matching an uploaded file.")
+            if name not in decoded_csvs:
+                decoded_csvs[name] = (await csv_files[name].read()).decode("utf-8")
+            campaign["csv_data"] = decoded_csvs[name]
+        campaigns.append(campaign)
+    return campaigns
+
+@app.post("/analyze_batch")
+async def analyze_campaign_batch(request: Request):
+    """
+    Runs many campaigns through the workflow with bounded concurrency.
+
+    Accepts either a raw JSONL body (application/x-ndjson, CSV inline as 'csv_data') or a
+    multipart bundle: a 'campaigns' JSONL file plus any number of 'csv_files' referenced by
+    filename. Results stream back as NDJSON, one line per campaign in completion order.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        manifest_part = form.get("campaigns")
+        if manifest_part is None:
+            raise HTTPException(status_code=400, detail="Multipart batch requires a 'campaigns' JSONL part.")
+        manifest = await manifest_part.read() if hasattr(manifest_part, "read") else manifest_part.encode("utf-8")
+        csv_files = {f.filename: f for f in form.getlist("csv_files") if hasattr(f, "read")}
+    else:
+        manifest = await request.body()
+        csv_files = {}
+
+    campaigns = await _parse_batch_manifest(manifest, csv_files)
+
+    async def result_lines():
+        async for index, state in run_agent_system_batch(campaigns):
+            yield json.dumps({
+                "index": index,
+                "campaign_id": campaigns[index].get("campaign_id"),
+                "result": state.model_dump(mode="json"),
+            }) + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+# --- 3c. STORED RESULTS ---
+def _require_store():
+    results_store = get_runtime().results_store
+    if results_store is None:
+        raise HTTPException(status_code=404, detail="Results store is disabled (RESULTS_STORE_ENABLED=false).")
+    return results_store
+
+@app.get("/results")
+async def list_results(
+    influencer_id: Optional[str] = Query(None),
+    policy_id: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None, description="Earliest campaign_date (YYYY-MM-DD)."),
+    date_to: Optional[str] = Query(None, description="Latest campaign_date (YYYY-MM-DD)."),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+):
+    """Paginated past runs, newest campaign first."""
+    store = _require_store()
+    items = await asyncio.to_thread(store.query, influencer_id, policy_id, date_from, date_to, limit, offset)
+    return {
+        "items": items,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if len(items) == limit else None,
+    }
+
+@app.get("/results/by_hash/{input_hash}", response_model=AgentState)
+async def get_result_by_hash(input_hash: str):
+    """Latest error-free run for the given AgentState.input_hash."""
+    store = _require_store()
+    state = await asyncio.to_thread(store.get_by_input_hash, input_hash)
+    if state is None:
+        raise HTTPException(status_code=404, detail="No stored result for this input hash.")
+    return state
+
 # --- 4. HEALTH CHECK ---
 @app.get("/health")
 def health_check():
     """Simple heartbeat."""
-    return {"status": "ok", "service": "influencer-agent"}
\ No newline at end of file
+    return {"status": "ok", "service": "influencer-agent"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness (distinct from /health): agents are built and, unless WARMUP_ON_STARTUP=false, warmed up."""
+    ready = runtime_initialized() and (get_runtime().warmed_up or not WARMUP_ON_STARTUP)
+    if not ready:
+        raise HTTPException(status_code=503, detail="Warming up.")
+    response = {"status": "ready", "service": "influencer-agent"}
+    if runtime_initialized() and get_runtime().warmup_error:
+        # Still serving, just without the warm caches; surfaced so a bad key/config is visible
+        response["warmup_error"] = get_runtime().warmup_error
+    return response
+
+# --- 5. METRICS ---
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Stage latency histograms, LLM call/token counters and cache hit rates (Prometheus text format)."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
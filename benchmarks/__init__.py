@@ -0,0 +1,7 @@
+"""
+Offline benchmark suite: a local Gemini stand-in, synthetic inputs and a harness.
+
+    python -m benchmarks.harness --out bench_results.json
+    python -m benchmarks.harness --compare old.json new.json
+    python -m benchmarks.import_budget
+"""
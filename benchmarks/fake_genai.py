@@ -0,0 +1,231 @@
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional
+import google.generativeai as genai
+from tools.finance_tools import mentions_rates_or_payments
+
+
+class LatencyModel:
+    """
+    Log-normal service time around a median, the usual shape of LLM latencies (long right tail).
+    sigma=0 gives a fixed latency.
+    """
+
+    def __init__(self, median_ms: float = 800.0, sigma: float = 0.35, per_output_token_ms: float = 0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.per_output_token_ms = per_output_token_ms
+
+    def sample(self, rng: random.Random, output_tokens: int = 0) -> float:
+        base = self.median_ms * math.exp(rng.gauss(0.0, self.sigma)) if self.sigma else self.median_ms
+        return (base + self.per_output_token_ms * output_tokens) / 1000.0
+
+
+class FakeBackend:
+    """
+    Configuration and counters shared by every fake model.
+
+    latency:        default LatencyModel, overridable per model name via model_latency
+    error_rate:     fraction of calls that raise (transport / quota errors)
+    malformed_rate: fraction of JSON replies sent back fenced with a trailing comma, which
+                    exercises the local repair path in the analyzer
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        model_latency: Optional[Dict[str, LatencyModel]] = None,
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        seed: int = 7,
+    ):
+        self.latency = latency or LatencyModel()
+        self.model_latency = model_latency or {}
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    def _draw(self, model_name: str) -> tuple:
+        """(fail, malformed, tone) for one call, and counts it."""
+        with self._lock:
+            self.calls[model_name] = self.calls.get(model_name, 0) + 1
+            return (
+                self._rng.random() < self.error_rate,
+                self._rng.random() < self.malformed_rate,
+                self._rng.randint(5, 9),
+            )
+
+    def latency_for(self, model_name: str, output_tokens: int = 0) -> float:
+        latency = self.model_latency.get(model_name, self.latency)
+        with self._lock:
+            return latency.sample(self._rng, output_tokens)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+
+def _content_metrics_json(prompt: str, tone: int) -> dict:
+    return {
+        "tone_score": tone,
+        "hook_strength": "High" if tone >= 8 else "Medium",
+        "key_themes": ["rates", "trust"],
+        "rate_check": "Valid" if "CURRENT MARKET RATE" in prompt or "rate_percentage" in prompt else "Not Applicable",
+        "deviation_summary": [],
+    }
+
+
+def _review_text(tone: int) -> str:
+    return (
+        "<thought_process>Market is a headwind; persona fit is adequate.</thought_process>\n"
+        f"Strategic Review: Tone {tone}/10. Volume is acceptable for the market context; "
+        "maintain the current copy and re-test the hook next cycle."
+    )
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel covering the calls the agents make."""
+
+    backend: FakeBackend = FakeBackend()
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", tools: Optional[List[Callable]] = None, system_instruction: Optional[str] = None, **kwargs):
+        self.model_name = model_name
+        self.tools = tools
+        self.system_instruction = system_instruction or ""
+
+    def _reply(self, prompt: str, generation_config: Optional[dict]) -> tuple:
+        """(latency seconds, response) for one generation; raises on an injected error."""
+        schema = (generation_config or {}).get("response_schema") or {}
+        is_review = "Lead Performance Strategist" in self.system_instruction
+        if "strategic_review" in schema.get("properties", {}):
+            kind = "combined"
+        elif is_review and not generation_config:
+            kind = "review"
+        else:
+            kind = "content"
+
+        fail, malformed, tone = self.backend._draw(self.model_name)
+        if fail:
+            raise RuntimeError("FakeGenAI injected error (503 Service Unavailable)")
+
+        if kind == "review":
+            text = _review_text(tone)
+        else:
+            payload = _content_metrics_json(prompt, tone)
+            if kind == "combined":
+                payload = {"content_analysis": payload, "strategic_review": _review_text(tone)}
+            text = json.dumps(payload)
+            if malformed:
+                text = "```json\n" + text[:-1] + ",}\n```"
+
+        usage = SimpleNamespace(
+            prompt_token_count=(len(self.system_instruction) + len(prompt)) // 4,
+            candidates_token_count=len(text) // 4,
+        )
+        latency = self.backend.latency_for(self.model_name, usage.candidates_token_count)
+        return latency, SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, prompt: str, generation_config: Optional[dict] = None, **kwargs):
+        latency, response = self._reply(prompt, generation_config)
+        time.sleep(latency)
+        return response
+
+    async def generate_content_async(self, prompt: str, generation_config: Optional[dict] = None, stream: bool = False, **kwargs):
+        latency, response = self._reply(prompt, generation_config)
+        if stream:
+            return FakeStreamResponse(response, latency)
+        await asyncio.sleep(latency)
+        return response
+
+    def start_chat(self, enable_automatic_function_calling: bool = False, **kwargs) -> "FakeChatSession":
+        return FakeChatSession(self, enable_automatic_function_calling)
+
+
+class FakeStreamResponse:
+    """
+    Async-iterable stand-in for a streamed generation. A quarter of the latency passes before
+    the first chunk (time to first token); the rest is spread across the remaining chunks.
+    """
+
+    def __init__(self, response: SimpleNamespace, latency: float, chunk_chars: int = 40):
+        self.usage_metadata = response.usage_metadata
+        self._text = response.text
+        self._latency = latency
+        self._chunk_chars = chunk_chars
+
+    async def __aiter__(self):
+        chunks = [self._text[i:i + self._chunk_chars] for i in range(0, len(self._text), self._chunk_chars)] or [""]
+        await asyncio.sleep(self._latency * 0.25)
+        per_chunk = self._latency * 0.75 / len(chunks)
+        for i, text in enumerate(chunks):
+            if i:
+                await asyncio.sleep(per_chunk)
+            yield SimpleNamespace(text=text)
+
+
+class FakeChatSession:
+    """
+    Mimics automatic function calling: when tools are enabled and the prompt mentions rates,
+    the first tool is actually invoked and an extra model turn (and its latency) is added.
+    """
+
+    def __init__(self, model: FakeGenerativeModel, afc: bool):
+        self.model = model
+        self.afc = afc
+        self.history: List[SimpleNamespace] = []
+
+    def _tool_round_trip(self, prompt: str) -> Optional[float]:
+        if not (self.afc and self.model.tools and mentions_rates_or_payments(prompt)):
+            return None
+        self.model.tools[0]("30_year_fixed")
+        self.history.append(SimpleNamespace(role="model"))  # the function-call turn
+        self.model.backend._draw(self.model.model_name)
+        return self.model.backend.latency_for(self.model.model_name)
+
+    def _record(self) -> None:
+        self.history.append(SimpleNamespace(role="user"))
+        self.history.append(SimpleNamespace(role="model"))
+
+    def send_message(self, prompt: str, generation_config: Optional[dict] = None, **kwargs):
+        tool_latency = self._tool_round_trip(prompt)
+        if tool_latency:
+            time.sleep(tool_latency)
+        latency, response = self.model._reply(prompt, generation_config)
+        time.sleep(latency)
+        self._record()
+        return response
+
+    async def send_message_async(self, prompt: str, generation_config: Optional[dict] = None, **kwargs):
+        tool_latency = self._tool_round_trip(prompt)
+        if tool_latency:
+            await asyncio.sleep(tool_latency)
+        latency, response = self.model._reply(prompt, generation_config)
+        await asyncio.sleep(latency)
+        self._record()
+        return response
+
+
+@contextmanager
+def install(backend: Optional[FakeBackend] = None) -> Iterator[FakeBackend]:
+    """
+    Swaps genai.GenerativeModel for the fake for the duration of the block.
+    The agents look the class up on the genai module at construction time, so this also
+    covers models built by the pools after main_graph has been imported.
+    """
+    backend = backend or FakeBackend()
+    original_model, original_configure = genai.GenerativeModel, genai.configure
+    FakeGenerativeModel.backend = backend
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.configure = lambda *args, **kwargs: None
+    try:
+        yield backend
+    finally:
+        genai.GenerativeModel, genai.configure = original_model, original_configure
@@ -0,0 +1,301 @@
+"""
+Offline benchmarks for the orchestrator, /analyze_live, the metrics engine and policy lookups.
+
+Gemini is replaced by benchmarks.fake_genai, so runs are free, repeatable and measure our own
+overhead plus a configurable model latency. Results are written as JSON keyed by commit:
+
+    python -m benchmarks.harness --out bench_results.json
+    python -m benchmarks.harness --only metrics,policy --csv-rows 1000000
+    python -m benchmarks.harness --compare old.json new.json
+
+The endpoint benchmark needs httpx (FastAPI's test client dependency).
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+# Offline defaults, set before any agent module reads its configuration
+os.environ.setdefault("RESULTS_STORE_ENABLED", "false")
+os.environ.setdefault("RATE_REFRESHER_ENABLED", "false")
+os.environ.setdefault("RATE_PROVIDER", "fixture")
+os.environ.setdefault("ANALYSIS_CACHE_DISABLED", "true")
+os.environ.setdefault("INCREMENTAL_ANALYSIS", "false")
+# No client-side rpm cap by default, so the fake latency (not the token bucket) is what's measured
+os.environ.setdefault("LLM_DEFAULT_RPM", "0")
+
+from benchmarks.fake_genai import FakeBackend, LatencyModel, install
+from benchmarks.synthetic import make_campaign, make_leads_csv, write_leads_csv, write_policies
+
+ALL_BENCHMARKS = ("metrics", "policy", "orchestrator", "endpoint")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], wall_seconds: float, **extra) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "requests_per_sec": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+        **extra,
+    }
+
+
+def _timed_loop(fn: Callable[[], object], iterations: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def _timed_concurrent(call: Callable[[int], Awaitable[bool]], requests: int, concurrency: int) -> dict:
+    """Runs `requests` calls with at most `concurrency` in flight; call() returns False on an error result."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            t0 = time.perf_counter()
+            ok = await call(i)
+            latencies.append(time.perf_counter() - t0)
+            errors += 0 if ok else 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - start, concurrency=concurrency, errors=errors)
+
+
+def bench_metrics(rows: int, iterations: int) -> dict:
+    from tools.metrics_engine import calculate_campaign_metrics, calculate_campaign_metrics_from_file, calculate_grouped_metrics
+
+    small_csv = make_leads_csv(500)
+    large_csv = make_leads_csv(rows)
+    results = {
+        "small_string": _timed_loop(lambda: calculate_campaign_metrics(small_csv), iterations * 20),
+        "large_string": _timed_loop(lambda: calculate_campaign_metrics(large_csv), iterations),
+        "grouped_by_date": _timed_loop(lambda: calculate_grouped_metrics(large_csv, "Date"), iterations),
+    }
+    with tempfile.TemporaryFile("w+b") as f:
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        write_leads_csv(text, rows)
+        text.flush()
+        text.detach()
+
+        def from_file():
+            f.seek(0)
+            return calculate_campaign_metrics_from_file(f)
+
+        results["large_file_stream"] = _timed_loop(from_file, iterations)
+    for summary in results.values():
+        summary["rows"] = rows
+    results["small_string"]["rows"] = 500
+    return results
+
+
+def bench_policy(policies: int, lookups: int) -> dict:
+    from tools.policy_manager import PolicyManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "policies.json")
+        history = write_policies(path, policies)
+        t0 = time.perf_counter()
+        manager = PolicyManager(path)
+        load_ms = round((time.perf_counter() - t0) * 1000, 3)
+
+        rng = random.Random(5)
+        first = date.fromisoformat(history[0]["start_date"])
+        span = (date.fromisoformat(history[-1]["end_date"]) - first).days
+        dates = [(first + timedelta(days=rng.randrange(span))).isoformat() for _ in range(lookups)]
+        it = iter(dates)
+        single = _timed_loop(lambda: manager.get_policy_for_date(next(it)), lookups)
+        single.update(policies=policies, load_ms=load_ms)
+
+        t0 = time.perf_counter()
+        manager.get_policies_for_dates(dates)
+        bulk_seconds = time.perf_counter() - t0
+    return {
+        "single_lookup": single,
+        "bulk_lookup": {"count": lookups, "total_ms": round(bulk_seconds * 1000, 3), "lookups_per_sec": round(lookups / bulk_seconds, 2), "policies": policies},
+    }
+
+
+async def bench_orchestrator(requests: int, concurrency: int, csv_rows: int, mode: str) -> dict:
+    import main_graph
+
+    rng = random.Random(1)
+    csv_data = make_leads_csv(csv_rows)
+    campaigns = [make_campaign(rng, i, csv_data) for i in range(requests)]
+    limits = main_graph.ConcurrencyLimits(analyzer=concurrency, coordinator=concurrency)
+
+    async def call(i: int) -> bool:
+        state = await main_graph.run_agent_system(**campaigns[i], limits=limits, mode=mode)
+        return not state.errors
+
+    return await _timed_concurrent(call, requests, concurrency)
+
+
+async def bench_endpoint(requests: int, concurrency: int, csv_rows: int, mode: str) -> Optional[dict]:
+    try:
+        import httpx
+    except ImportError:
+        print("   [BENCH] ⚠️  httpx not installed, skipping the /analyze_live benchmark.")
+        return None
+    from app import app
+
+    rng = random.Random(2)
+    csv_bytes = make_leads_csv(csv_rows).encode("utf-8")
+    campaigns = [make_campaign(rng, i, "") for i in range(requests)]
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def call(i: int) -> bool:
+            c = campaigns[i]
+            response = await client.post(
+                "/analyze_live",
+                files={"csv_file": ("leads.csv", csv_bytes, "text/csv")},
+                data={
+                    "approved_script": c["approved_script"],
+                    "influencer_transcript": c["influencer_transcript"],
+                    "campaign_date": c["campaign_date_str"],
+                    "influencer_profile": json.dumps(c["influencer_data"]),
+                    "mode": mode,
+                },
+            )
+            return response.status_code == 200 and not response.json().get("errors")
+
+        return await _timed_concurrent(call, requests, concurrency)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> dict:
+    selected = ALL_BENCHMARKS if args.only == "all" else tuple(args.only.split(","))
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "llm_default_rpm": os.environ["LLM_DEFAULT_RPM"],
+        "results": {},
+    }
+
+    if "metrics" in selected:
+        print(f"   [BENCH] 🧮 Metrics engine ({args.csv_rows} rows)...")
+        report["results"]["metrics"] = bench_metrics(args.csv_rows, args.iterations)
+    if "policy" in selected:
+        print(f"   [BENCH] 📜 Policy lookups ({args.policies} policies)...")
+        report["results"]["policy"] = bench_policy(args.policies, args.lookups)
+
+    backend = FakeBackend(
+        latency=LatencyModel(args.latency_ms, args.sigma),
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+    )
+    with install(backend):
+        if "orchestrator" in selected:
+            print(f"   [BENCH] 🧠 Orchestrator ({args.requests} requests, concurrency {args.concurrency})...")
+            report["results"]["orchestrator"] = asyncio.run(
+                bench_orchestrator(args.requests, args.concurrency, args.request_csv_rows, args.mode)
+            )
+        if "endpoint" in selected:
+            print(f"   [BENCH] 🌐 /analyze_live ({args.requests} requests, concurrency {args.concurrency})...")
+            endpoint = asyncio.run(bench_endpoint(args.requests, args.concurrency, args.request_csv_rows, args.mode))
+            if endpoint is not None:
+                report["results"]["endpoint"] = endpoint
+    report["model_calls"] = dict(backend.calls)
+    return report
+
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict) and "count" not in value:
+            flat.update(_flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, dict):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Prints p50/p95/p99 and throughput deltas between two saved runs."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_flat, new_flat = _flatten(old["results"]), _flatten(new["results"])
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for name in sorted(set(old_flat) & set(new_flat)):
+        line = [f"{name:32}"]
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "requests_per_sec", "lookups_per_sec"):
+            a, b = old_flat[name].get(metric), new_flat[name].get(metric)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            line.append(f"{metric}={b} ({change:+.1f}%)")
+        print("  ".join(line))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks (no Gemini calls).")
+    parser.add_argument("--out", default="bench_results.json", help="Where to write the JSON report.")
+    parser.add_argument("--only", default="all", help=f"Comma-separated subset of {','.join(ALL_BENCHMARKS)}.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved reports and exit.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mode", default="standard", choices=("standard", "fast"))
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Median fake model latency.")
+    parser.add_argument("--sigma", type=float, default=0.35, help="Log-normal spread of the fake latency (0 = fixed).")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=float, default=None, help="Client-side rpm cap per model (default: LLM_DEFAULT_RPM, 0 = none).")
+    parser.add_argument("--csv-rows", type=int, default=200000, help="Rows in the metrics-engine CSV.")
+    parser.add_argument("--request-csv-rows", type=int, default=500, help="Rows in the CSV attached to each request.")
+    parser.add_argument("--iterations", type=int, default=5, help="Repetitions of each large-CSV metrics run.")
+    parser.add_argument("--policies", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.llm_rpm is not None:
+        # Read when the LLM client is built, which happens on the first benchmarked request
+        os.environ["LLM_DEFAULT_RPM"] = str(args.llm_rpm)
+
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"   [BENCH] ✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
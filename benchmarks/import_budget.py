@@ -0,0 +1,75 @@
+"""
+Import-time budget for service cold start.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, reports the total and the
+slowest top-level imports, and exits non-zero when the total exceeds the budget or a module
+that should load lazily (the Gemini SDK, pandas) was imported eagerly.
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 800 --out import_budget.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+# Loaded by the lifespan hook / first request, never by `import app`
+LAZY_MODULES = ("google.generativeai", "pandas")
+
+
+def measure(target: str = "app") -> dict:
+    code = f"import sys, json; import {target}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, "RATE_REFRESHER_ENABLED": "false"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"`import {target}` failed:\n{proc.stderr[-2000:]}")
+
+    top_level = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not name.startswith(" ") or name.startswith("  "):
+            continue  # nested import, already counted in its parent's cumulative time
+        top_level.append((name.strip(), int(cumulative) / 1000.0))
+
+    loaded = set(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "target": target,
+        "total_ms": round(sum(ms for _, ms in top_level), 1),
+        "slowest": [{"module": m, "ms": round(ms, 1)} for m, ms in sorted(top_level, key=lambda x: -x[1])[:10]],
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in loaded],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure `import app` against a cold-start budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--target", default="app")
+    parser.add_argument("--out", help="Optional path for a JSON report.")
+    args = parser.parse_args(argv)
+
+    report = measure(args.target)
+    report["budget_ms"] = args.budget_ms
+    report["within_budget"] = report["total_ms"] <= args.budget_ms and not report["eager_lazy_modules"]
+
+    print(f"   [IMPORT] ⏱️  import {args.target}: {report['total_ms']}ms (budget {args.budget_ms}ms)")
+    for entry in report["slowest"]:
+        print(f"      {entry['ms']:>8.1f}ms  {entry['module']}")
+    if report["eager_lazy_modules"]:
+        print(f"   [IMPORT] ❌ Imported eagerly: {report['eager_lazy_modules']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["within_budget"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+import os
+import random
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import List, Optional, TextIO
+
+APPROVED_SCRIPT = (
+    "Rates moved again this month, but a 10-day close and no lender fees means you can lock it in "
+    "before the spring rush. Talk to a local expert today. NMLS #12345. Equal Housing Lender."
+)
+
+_FILLER = (
+    "honestly", "so", "the thing is", "look", "you know", "my family", "last spring", "we refinanced",
+    "the process was quick", "I was nervous", "the team walked me through it", "monthly payment",
+    "local expert", "guide you home", "salary-based advisors", "no pressure", "beat your bank",
+)
+_FORBIDDEN = ("guaranteed approval", "crypto", "no credit check", "risk-free investment")
+_ARCHETYPES = ("Skeptic", "Conservative", "Community", "News", "Culture", "Educator")
+_BUNDLED_POLICIES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "policies.json")
+
+
+def make_transcript(rng: random.Random, words: int = 180, compliance_phrases=("NMLS #12345", "Equal Housing Lender"), missing_rate: float = 0.2, forbidden_rate: float = 0.1) -> str:
+    """A rambling read of the approved script, sometimes dropping a disclosure or straying off-policy."""
+    parts: List[str] = []
+    while sum(len(p.split()) for p in parts) < words:
+        sentence = " ".join(rng.choice(_FILLER) for _ in range(rng.randint(4, 9)))
+        if rng.random() < forbidden_rate:
+            sentence += f", {rng.choice(_FORBIDDEN)}"
+        if rng.random() < 0.3:
+            sentence += f" at {rng.uniform(5.5, 7.9):.2f}%"
+        parts.append(sentence.capitalize() + ".")
+    for phrase in compliance_phrases:
+        if rng.random() >= missing_rate:
+            parts.append(f"{phrase}.")
+    # Unique tail so generated transcripts never collide in caches or single-flight
+    parts.append(f"Ref {rng.getrandbits(48):x}.")
+    return " ".join(parts)
+
+
+def make_influencer(rng: random.Random, idx: int) -> dict:
+    return {
+        "id": f"INF-{idx:05d}",
+        "name": f"Creator {idx}",
+        "archetypes": rng.sample(_ARCHETYPES, k=rng.randint(1, 3)),
+        "avg_lead_volume": rng.randint(20, 400),
+    }
+
+
+def make_policies(count: int, start: date = date(2020, 1, 1), seed: int = 11) -> List[dict]:
+    """A contiguous, non-overlapping policy history (as policies.json holds it)."""
+    rng = random.Random(seed)
+    policies, cursor = [], start
+    for i in range(count):
+        end = cursor + timedelta(days=rng.randint(7, 45))
+        policies.append({
+            "policy_id": f"POL-SYN-{i:05d}",
+            "name": f"Synthetic Policy {i}",
+            "start_date": cursor.isoformat(),
+            "end_date": end.isoformat(),
+            "market_trigger": rng.choice(["Stable Rates", "Rate Hike (+0.5%)", "Competitor Price War", "Market Normalization"]),
+            "focus_phrases": rng.sample(["lock it in", "don't wait", "local expert", "beat your bank", "10-day close", "fresh start"], k=3),
+            "compliance_phrases": ["NMLS #12345", "Equal Housing Lender"],
+            "forbidden_topics": list(_FORBIDDEN[:2]),
+        })
+        cursor = end + timedelta(days=1)
+    return policies
+
+
+def write_policies(path: str, count: int, start: date = date(2020, 1, 1), seed: int = 11) -> List[dict]:
+    policies = make_policies(count, start, seed)
+    with open(path, "w") as f:
+        json.dump(policies, f, indent=2)
+    return policies
+
+
+def write_leads_csv(out: TextIO, rows: int, seed: int = 3, start: date = date(2024, 1, 1), influencers: int = 50, extra_columns: int = 6) -> None:
+    """
+    A CRM-style lead export: the three summed columns plus Date / Influencer ID and some
+    unused text columns, so the parser's column pruning is part of what gets measured.
+    Written row by row, so multi-GB files never sit in memory.
+    """
+    rng = random.Random(seed)
+    writer = csv.writer(out)
+    extras = [f"Notes {i}" for i in range(extra_columns)]
+    writer.writerow(["Date", "Influencer ID", "New Leads", "SignOffs", "Closes", *extras])
+    for i in range(rows):
+        leads = rng.randint(0, 40)
+        lost = rng.randint(0, leads)
+        writer.writerow([
+            (start + timedelta(days=i % 90)).isoformat(),
+            f"INF-{rng.randrange(influencers):05d}",
+            leads, lost, rng.randint(0, leads - lost),
+            *("lorem ipsum" for _ in extras),
+        ])
+
+
+def make_leads_csv(rows: int, seed: int = 3, **kwargs) -> str:
+    buf = io.StringIO()
+    write_leads_csv(buf, rows, seed=seed, **kwargs)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=None)
+def policy_dates(path: str = _BUNDLED_POLICIES) -> tuple:
+    """Every day covered by a closed window in `path` (the history has gaps, e.g. 2024-02-29)."""
+    with open(path) as f:
+        policies = json.load(f)
+    days = []
+    for policy in policies:
+        if not policy.get("end_date"):
+            continue
+        day, end = date.fromisoformat(policy["start_date"]), date.fromisoformat(policy["end_date"])
+        while day <= end:
+            days.append(day)
+            day += timedelta(days=1)
+    return tuple(days)
+
+
+def make_campaign(rng: random.Random, idx: int, csv_data: str, campaign_date: Optional[str] = None) -> dict:
+    """One run_agent_system() input set, dated inside one of the bundled policies.json windows."""
+    return {
+        "approved_script": APPROVED_SCRIPT,
+        "influencer_transcript": make_transcript(rng),
+        "csv_data": csv_data,
+        "campaign_date_str": campaign_date or rng.choice(policy_dates()).isoformat(),
+        "influencer_data": make_influencer(rng, idx),
+    }
@@ -0,0 +1,6 @@
+import os
+
+# Offline defaults, set before any agent module reads its configuration
+os.environ.setdefault("RESULTS_STORE_ENABLED", "false")
+os.environ.setdefault("RATE_REFRESHER_ENABLED", "false")
+os.environ.setdefault("RATE_PROVIDER", "fixture")
@@ -1,37 +1,235 @@
 import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
-from agents.analyzer import ContentAnalyzerAgent
-from agents.coordinator import ReviewCoordinatorAgent
-from tools.metrics_engine import calculate_campaign_metrics
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+from tools.metrics_engine import compute_metrics, compute_metrics_from_path, is_small_csv
+from tools.compliance_scanner import merge_scan_into_analysis, scan_transcript
+from tools.finance_tools import rate_cache
+from tools.fingerprint import file_digest, stable_hash, text_digest
+from tools.instrumentation import cache_collector, current_timings, registry, stage_timer, start_request_timings
+from tools.loop_local import LoopLocal
 from tools.policy_manager import PolicyManager
-from tools.models import AgentState, InfluencerProfile, InfluencerTag
+from tools.response_cache import ResponseCache
+from tools.results_store import ResultsStore, compute_input_hash
+from tools.models import AgentState, BrandPolicy, ContentMetrics, GroupedMetrics, InfluencerProfile, InfluencerTag, PerformanceMetrics
 
-# Initialize Agents and Managers (Singletons)
-caa = ContentAnalyzerAgent()
-rca = ReviewCoordinatorAgent()
-policy_manager = PolicyManager()
+registry.describe("pipeline_stages_reused_total", "Stages skipped on incremental runs because their inputs were unchanged.")
 
-async def run_agent_system(approved_script: str, influencer_transcript: str, csv_data: str, campaign_date_str: str, influencer_data: dict) -> AgentState:
+# Worker processes for parsing large CSVs (0 = parse on a thread in this process)
+METRICS_PROCESS_WORKERS = int(os.getenv("METRICS_PROCESS_WORKERS", "0"))
+
+class Runtime:
     """
-    The Core Orchestration Logic.
-    1. Looks up Brand Policy based on date (Time Travel).
-    2. Runs Content Analysis (Tool Use) and Metrics Calculation (Deterministic) in parallel.
-    3. Synthesizes all inputs via the Review Coordinator.
+    The process's agents and managers (singletons). Built on first use or by the app's
+    lifespan hook rather than at import, so importing main_graph doesn't pay for the
+    Gemini SDK, .env loading or model construction.
     """
-    print("\n--- 🚀 Starting Orchestration with Context Lookup ---")
-    start_total = time.time()
-    
+    def __init__(self):
+        # The agent modules pull in google.generativeai, so they're imported here
+        from agents.analyzer import ContentAnalyzerAgent
+        from agents.coordinator import ReviewCoordinatorAgent
+        
+        self.caa = ContentAnalyzerAgent()
+        self.rca = ReviewCoordinatorAgent()
+        self.policy_manager = PolicyManager()
+        self.results_store = ResultsStore.from_env()
+        self.warmed_up = False
+        self.warmup_error: Optional[str] = None
+        # Stage outputs by input fingerprint, for incremental re-analysis (see _stage_fingerprints)
+        self.stage_memo = ResponseCache.from_env("pipeline_stages")
+        # spawn rather than fork: this process already runs threads (rate refresher, to_thread workers)
+        self.metrics_pool = ProcessPoolExecutor(
+            METRICS_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        ) if METRICS_PROCESS_WORKERS > 0 else None
+        
+        # Keep the mortgage-rate cache warm so the analyzer's tool call never waits on the feed
+        if os.getenv("RATE_REFRESHER_ENABLED", "true").lower() not in ("0", "false", "no"):
+            rate_cache.start_refresher()
+
+    def collect(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Cache and model-pool stats, read at scrape time by the /metrics endpoint."""
+        samples = []
+        if hasattr(self.caa.cache, "stats"):
+            samples += cache_collector("content_analysis", self.caa.cache.stats)()
+        samples += cache_collector("pipeline_stages", self.stage_memo.stats)()
+        samples += [
+            ("model_pool_models", {"pool": name, "model": pool.model_name}, pool.stats()["size"])
+            for name, pool in (
+                ("analyzer", self.caa.model_pool), ("analyzer_inline", self.caa.inline_model_pool),
+                ("coordinator", self.rca.model_pool), ("fast", self.rca.fast_model_pool),
+            )
+        ]
+        return samples
+
+    def warmup(self) -> dict:
+        """
+        Front-loads first-request costs: analyzer models and scanners for the latest policies,
+        pandas for the streaming CSV path, the metrics process pool, and the current mortgage rate.
+        Best effort: a failure is logged and kept on warmup_error, and the runtime still counts as
+        warmed up (requests then just pay those costs themselves).
+        """
+        start = time.perf_counter()
+        policies = 0
+        try:
+            policies = self.caa.warmup(self.policy_manager.policies)
+            import pandas  # noqa: F401
+            if self.metrics_pool is not None:
+                # Spawned workers start on first submit; pay for their interpreter start-up now
+                probe = ",".join(("New Leads", "SignOffs", "Closes")) + "\n"
+                for future in [self.metrics_pool.submit(compute_metrics, probe) for _ in range(METRICS_PROCESS_WORKERS)]:
+                    future.result()
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"   [WARMUP] ❌ Warmup failed: {e}")
+        try:
+            rate_cache.get("30_year_fixed")
+        except Exception as e:
+            print(f"   [WARMUP] ⚠️  Rate prefetch failed: {e}")
+        self.warmed_up = True
+        elapsed = round(time.perf_counter() - start, 3)
+        print(f"   [WARMUP] 🔥 Warmed {policies} policies in {elapsed}s.")
+        return {"policies": policies, "seconds": elapsed, "error": self.warmup_error}
+
+    def close(self) -> None:
+        rate_cache.stop_refresher()
+        if self.metrics_pool is not None:
+            self.metrics_pool.shutdown(wait=False, cancel_futures=True)
+        if self.results_store is not None:
+            self.results_store.close()
+
+_runtime: Optional[Runtime] = None
+_runtime_lock = threading.Lock()
+
+def get_runtime() -> Runtime:
+    """The process-wide Runtime, built on first call."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                t0 = time.perf_counter()
+                _runtime = Runtime()
+                registry.observe("stage_duration_seconds", time.perf_counter() - t0, stage="runtime_init")
+    return _runtime
+
+# Registered once for the module, not per Runtime, so a rebuilt runtime doesn't duplicate series
+registry.register_collector(lambda: _runtime.collect() if _runtime is not None else [])
+
+def runtime_initialized() -> bool:
+    return _runtime is not None
+
+def shutdown_runtime() -> None:
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            _runtime.close()
+            _runtime = None
+
+class ConcurrencyLimits:
+    """
+    Caps on in-flight calls per model, shared by every campaign that uses the same limits.
+    Model calls are native async, so these (not the thread-pool size) bound concurrency.
+    """
+    def __init__(self, analyzer: int, coordinator: int):
+        self.analyzer_limit = analyzer
+        self.coordinator_limit = coordinator
+        # Created lazily per event loop; module-level default_limits outlives any one loop
+        self._per_loop = LoopLocal(lambda: (asyncio.Semaphore(analyzer), asyncio.Semaphore(coordinator)))
+
+    @property
+    def analyzer(self) -> asyncio.Semaphore:
+        return self._per_loop.get()[0]
+
+    @property
+    def coordinator(self) -> asyncio.Semaphore:
+        return self._per_loop.get()[1]
+
+default_limits = ConcurrencyLimits(
+    analyzer=int(os.getenv("ANALYZER_CONCURRENCY", "16")),
+    coordinator=int(os.getenv("COORDINATOR_CONCURRENCY", "8"))
+)
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key onto one shared task.
+
+    Every caller awaits the task through asyncio.shield, so one caller giving up does not
+    cancel the work for the others; the task is only cancelled once its last waiter has
+    gone. Exceptions raised by the task propagate to every waiter. Callers that joined an
+    existing flight receive a deep copy of the result so they can't mutate each other's state.
+    """
+    class _Flight:
+        def __init__(self, task: asyncio.Task):
+            self.task = task
+            self.waiters = 0
+
+    def __init__(self):
+        self._flights: Dict[str, "SingleFlight._Flight"] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[AgentState]]) -> AgentState:
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = SingleFlight._Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task, key=key, flight=flight: self._on_done(key, flight))
+        else:
+            print("   [DEDUP] 🔗 Joining identical in-flight analysis.")
+            registry.inc("singleflight_joins_total")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.done() and flight.task.cancelled():
+                # The shared work itself was cancelled while we were still waiting on it
+                raise RuntimeError("Shared analysis was cancelled before completing") from None
+            raise
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller has gone away: no one needs the result any more. Forget the flight
+                # now, so a retry starts fresh instead of joining a task that is being torn down
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+        return result if leader else result.model_copy(deep=True)
+
+    def _on_done(self, key: str, flight: "SingleFlight._Flight") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Mark the exception retrieved even if every waiter left before it was raised
+            flight.task.exception()
+
+single_flight = SingleFlight()
+
+PIPELINE_MODES = ("standard", "fast")
+
+async def _initialize(approved_script: str, influencer_transcript: str, csv_data: str, campaign_date_str: str, influencer_data: dict, csv_stream: Optional[BinaryIO], group_by: Optional[str], mode: str, incremental: bool = False, brand: Optional[str] = None) -> Tuple[AgentState, Optional[BrandPolicy]]:
+    """Validation, policy lookup and fingerprinting. On failure returns a failed state and no policy."""
     # 1. Initialization and Policy Lookup (The Governance Layer)
     try:
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}' (expected one of {PIPELINE_MODES})")
         campaign_date = date.fromisoformat(campaign_date_str)
         # Validate and unpack the influencer data
         influencer_profile = InfluencerProfile(**influencer_data)
         
         # GEAR 3 INTEGRATION: Find the active policy for the campaign date
-        active_policy = policy_manager.get_policy_for_date(campaign_date_str)
+        with stage_timer("policy_lookup"):
+            active_policy = get_runtime().policy_manager.get_policy_for_date(campaign_date_str, brand=brand)
         if not active_policy:
-            raise ValueError(f"No active Brand Policy found for date {campaign_date_str}")
+            for_brand = f" (brand '{brand}')" if brand else ""
+            raise ValueError(f"No active Brand Policy found for date {campaign_date_str}{for_brand}")
         
         # Create the central state object (active_policy is a Pydantic object, so we pass it directly)
         state = AgentState(
@@ -42,6 +240,17 @@ async def run_agent_system(approved_script: str, influencer_transcript: str, csv
             influencer_profile=influencer_profile,
             brand_policy=active_policy # Pydantic object access will use dot notation
         )
+        
+        # Fingerprint the inputs (the CSV by digest, so streamed uploads aren't held in memory)
+        with stage_timer("fingerprint"):
+            csv_digest = await asyncio.to_thread(file_digest, csv_stream) if csv_stream is not None else text_digest(csv_data)
+            state.input_hash = compute_input_hash(
+                approved_script, influencer_transcript, csv_digest, campaign_date.isoformat(),
+                influencer_profile.model_dump(mode="json"), group_by, mode, active_policy.model_dump(mode="json"), brand
+            )
+            if incremental:
+                # The content fingerprint may look up the current rate, so it's taken off the event loop
+                state.stage_fingerprints = await asyncio.to_thread(_stage_fingerprints, state, active_policy, csv_digest, group_by)
 
     except Exception as e:
         print(f"   [INIT] ❌ Initialization Failed: {e}")
@@ -50,57 +259,463 @@ async def run_agent_system(approved_script: str, influencer_transcript: str, csv
             approved_script="", influencer_transcript="", csv_data="", errors=[f"Initialization Failed: {e}"], 
             campaign_date=date.today(), 
             influencer_profile=InfluencerProfile(id="", name="", archetypes=[])
+        ), None
+
+    return state, active_policy
+
+def _incremental_default() -> bool:
+    return os.getenv("INCREMENTAL_ANALYSIS", "true").lower() not in ("0", "false", "no")
+
+def _stage_fingerprints(state: AgentState, policy: BrandPolicy, csv_digest: str, group_by: Optional[str]) -> Dict[str, str]:
+    """
+    Per-stage input fingerprints. Content analysis uses the analyzer's own cache key (script,
+    transcript, instruction, current rate), so it is only memoized while the analyzer cache is
+    on; metrics depend only on the CSV. Fast mode's combined call is a different model and
+    prompt, so its content is kept under its own "fast_content" key and never reused by a
+    standard run. The review's fingerprint is taken later, from the map outputs (see
+    _review_fingerprint).
+    """
+    fingerprints = {"metrics": stable_hash("metrics", csv_digest, group_by)}
+    runtime = get_runtime()
+    content_key = runtime.caa.fingerprint(
+        state.approved_script, state.influencer_transcript, policy.compliance_phrases, policy.forbidden_topics
+    )
+    if content_key is not None:
+        fingerprints["content"] = stable_hash("content", content_key, policy.policy_id)
+        fingerprints["fast_content"] = stable_hash(
+            "content", "combined", runtime.rca.fast_model_pool.model_name, content_key, policy.policy_id
+        )
+    return fingerprints
+
+def _review_fingerprint(state: AgentState, producer: Optional[str] = None) -> None:
+    """
+    The coordinator's inputs are the map outputs, so a CSV fix that leaves the totals unchanged
+    reuses the review. `producer` names whatever wrote the review (the coordinator's model by
+    default), so a fast-mode review is never served to a standard run.
+    """
+    if state.stage_fingerprints:
+        state.stage_fingerprints["review"] = stable_hash(
+            "review", producer or get_runtime().rca.model.model_name, state.content_analysis,
+            _performance_context(state), state.brand_policy, state.influencer_profile
         )
 
+def _memo_hit(state: AgentState, stage: str, value: Optional[Any]) -> Optional[Any]:
+    if value is not None:
+        print(f"   [MEMO] ♻️  {stage} inputs unchanged, reusing the previous output.")
+        state.reused_stages.append(stage)
+        registry.inc("pipeline_stages_reused_total", stage=stage)
+    return value
 
+def _memo_get(state: AgentState, stage: str) -> Optional[Any]:
+    """For worker threads; coroutines use _memo_get_async (the memo may have a SQLite tier)."""
+    fingerprint = state.stage_fingerprints.get(stage)
+    if fingerprint is None:
+        return None
+    return _memo_hit(state, stage, get_runtime().stage_memo.get(fingerprint))
+
+async def _memo_get_async(state: AgentState, stage: str) -> Optional[Any]:
+    fingerprint = state.stage_fingerprints.get(stage)
+    if fingerprint is None:
+        return None
+    return _memo_hit(state, stage, await get_runtime().stage_memo.get_async(fingerprint))
+
+def _memo_set(state: AgentState, stage: str, value: Any) -> None:
+    """Values must be JSON-friendly (the memo may have a SQLite tier)."""
+    fingerprint = state.stage_fingerprints.get(stage)
+    if fingerprint is not None:
+        get_runtime().stage_memo.set(fingerprint, value)
+
+async def _memo_set_async(state: AgentState, stage: str, value: Any) -> None:
+    fingerprint = state.stage_fingerprints.get(stage)
+    if fingerprint is not None:
+        await get_runtime().stage_memo.set_async(fingerprint, value)
+
+async def run_agent_system(approved_script: str, influencer_transcript: str, csv_data: str, campaign_date_str: str, influencer_data: dict, limits: Optional[ConcurrencyLimits] = None, csv_stream: Optional[BinaryIO] = None, group_by: Optional[str] = None, reuse_stored: Optional[bool] = None, mode: Optional[str] = None, speculative: bool = False, incremental: Optional[bool] = None, brand: Optional[str] = None) -> AgentState:
+    """
+    The Core Orchestration Logic.
+    1. Looks up Brand Policy based on date (Time Travel).
+    2. Runs Content Analysis (Tool Use) and Metrics Calculation (Deterministic) in parallel.
+    3. Synthesizes all inputs via the Review Coordinator.
+
+    Large uploads can pass `csv_stream` (a binary file object) instead of `csv_data`;
+    the metrics are then computed in bounded-memory chunks and csv_data stays empty.
+    With `group_by` (a CSV column such as a date or influencer ID) the metrics engine also
+    produces a per-group breakdown on state.performance_breakdown.
+    With `reuse_stored` (default: REUSE_STORED_RESULTS env) an earlier error-free run with
+    identical inputs is returned from the results store instead of calling the models.
+    With `mode="fast"` (default: PIPELINE_MODE env) the analysis and review come from one
+    structured generation, falling back to the two-stage path if it fails validation;
+    `speculative` starts the two-stage analyzer alongside it so the fallback is already in flight.
+    With `incremental` (default: INCREMENTAL_ANALYSIS env, on) each stage's output is memoized
+    by its own input fingerprint, so a resubmission only re-runs the stages whose inputs changed:
+    a CSV fix skips the content analysis, and the coordinator is skipped if its inputs are unchanged.
+    """
+    print("\n--- 🚀 Starting Orchestration with Context Lookup ---")
+    start_total = time.time()
+    limits = limits or default_limits
+    start_request_timings()
+    mode = mode or os.getenv("PIPELINE_MODE", "standard")
+    if incremental is None:
+        incremental = _incremental_default()
+    
+    state, active_policy = await _initialize(approved_script, influencer_transcript, csv_data, campaign_date_str, influencer_data, csv_stream, group_by, mode, incremental, brand)
+    if active_policy is None:
+        return state
+
+    if reuse_stored is None:
+        reuse_stored = os.getenv("REUSE_STORED_RESULTS", "").lower() in ("1", "true", "yes")
+    results_store = get_runtime().results_store
+    if reuse_stored and results_store is not None:
+        stored = await asyncio.to_thread(results_store.get_by_input_hash, state.input_hash)
+        if stored is not None:
+            print("   [STORE] 📦 Identical inputs found, serving stored result.")
+            return stored
+
+    # Concurrent identical requests (multiple tabs, client retries) share one in-flight run
+    return await single_flight.run(
+        state.input_hash,
+        lambda: _run_stages(state, active_policy, limits, csv_stream, group_by, start_total, mode, speculative)
+    )
+
+async def _content_stage(state: AgentState, active_policy: BrandPolicy, limits: ConcurrencyLimits) -> ContentMetrics:
+    memoized = await _memo_get_async(state, "content")
+    if memoized is not None:
+        return ContentMetrics.model_validate(memoized)
+    # Native async SDK call: waits on the network without holding an executor thread
+    async with limits.analyzer:
+        print("   [Map] 🧠 Content Agent analyzing...")
+        with stage_timer("content_analysis"):
+            # CRITICAL FIX: Pass both the approved script and the transcript
+            analysis = await get_runtime().caa.analyze_async(
+                state.approved_script, 
+                state.influencer_transcript, 
+                active_policy.compliance_phrases, 
+                active_policy.forbidden_topics,
+                policy_id=active_policy.policy_id
+            )
+        from agents.analyzer import is_error_record
+        if is_error_record(analysis):
+            # Surface it instead of letting an "ERROR" record pass as a real analysis
+            state.errors.append(f"Content Analysis Error: {analysis['deviation_summary'][0]}")
+            return ContentMetrics.model_validate(analysis)
+        content = ContentMetrics.model_validate(analysis)
+        await _memo_set_async(state, "content", content.model_dump(mode="json"))
+        return content
+
+def _metrics_stage(state: AgentState, csv_stream: Optional[BinaryIO], group_by: Optional[str]) -> Tuple[PerformanceMetrics, Optional[GroupedMetrics]]:
+    """CPU-bound; callers run it on a thread (which hands large CSVs to the process pool, if configured)."""
+    memoized = _memo_get(state, "metrics")
+    if memoized is not None:
+        breakdown = memoized["breakdown"]
+        return PerformanceMetrics.model_validate(memoized["performance"]), GroupedMetrics.model_validate(breakdown) if breakdown else None
+    print("   [Map] 🧮 Metrics Engine calculating...")
+    with stage_timer("csv_metrics"):
+        pool = get_runtime().metrics_pool
+        if pool is not None:
+            performance, breakdown = _metrics_in_pool(pool, state.csv_data, csv_stream, group_by)
+        else:
+            performance, breakdown = compute_metrics(state.csv_data, csv_stream, group_by)
+    _memo_set(state, "metrics", {
+        "performance": performance.model_dump(mode="json"),
+        "breakdown": breakdown.model_dump(mode="json") if breakdown is not None else None,
+    })
+    return performance, breakdown
+
+def _metrics_in_pool(pool: ProcessPoolExecutor, csv_data: str, csv_stream: Optional[BinaryIO], group_by: Optional[str]) -> Tuple[PerformanceMetrics, Optional[GroupedMetrics]]:
+    """Parses in a worker process so the parse doesn't hold this process's GIL."""
+    if csv_stream is None:
+        if is_small_csv(csv_data):
+            return compute_metrics(csv_data, None, group_by)  # Cheaper than the pickling round trip
+        return pool.submit(compute_metrics, csv_data, None, group_by).result()
+    # File objects don't pickle: spool the upload to a named temp file and send the path
+    with tempfile.NamedTemporaryFile(suffix=".csv") as f:
+        shutil.copyfileobj(csv_stream, f)
+        f.flush()
+        return pool.submit(compute_metrics_from_path, f.name, group_by).result()
+
+def _performance_context(state: AgentState) -> dict:
+    context = state.performance_data.model_dump()
+    if state.performance_breakdown is not None:
+        # Gives the coordinator a series to judge headwinds/tailwinds against
+        context["breakdown"] = state.performance_breakdown.model_dump()
+    return context
+
+async def _run_stages(state: AgentState, active_policy: BrandPolicy, limits: ConcurrencyLimits, csv_stream: Optional[BinaryIO], group_by: Optional[str], start_total: float, mode: str = "standard", speculative: bool = False) -> AgentState:
+    """Map and Reduce steps for an initialized state."""
     # 2. Parallel Execution (Map Step)
     def run_content_task():
-        print("   [Map] 🧠 Content Agent analyzing...")
-        # CRITICAL FIX: Pass both the approved script and the transcript
-        return caa.analyze(
-            approved_script, 
-            influencer_transcript, 
-            active_policy.compliance_phrases, 
-            active_policy.forbidden_topics
-        )
+        return _content_stage(state, active_policy, limits)
 
     def run_data_task():
-        print("   [Map] 🧮 Metrics Engine calculating...")
-        return calculate_campaign_metrics(csv_data)
+        return _metrics_stage(state, csv_stream, group_by)
+
+    def performance_context() -> dict:
+        return _performance_context(state)
 
+    async def run_combined_task():
+        async with limits.coordinator:
+            print("   [Fast] ⚡ Single-call analysis + review...")
+            with stage_timer("combined"):
+                return await get_runtime().rca.combined_review_async(
+                    state.approved_script,
+                    state.influencer_transcript,
+                    active_policy.compliance_phrases,
+                    active_policy.forbidden_topics,
+                    performance_context(),
+                    state.brand_policy.model_dump(),
+                    state.influencer_profile.model_dump()
+                )
+
+    content_task = None
     try:
-        content_result, data_result = await asyncio.gather(
-            asyncio.to_thread(run_content_task),
-            asyncio.to_thread(run_data_task)
-        )
-        # Update State
-        state.content_analysis = content_result
-        state.performance_data = data_result
+        # A two-stage analysis is good enough for fast mode too, but not the other way around
+        memoized_content = (await _memo_get_async(state, "content") or await _memo_get_async(state, "fast_content")) if mode == "fast" else None
+        if memoized_content is not None:
+            # Content unchanged: the combined call would only redo it, so go straight to the (memoized) coordinator
+            state.pipeline_mode = "fast"
+            state.content_analysis = ContentMetrics.model_validate(memoized_content)
+            state.performance_data, state.performance_breakdown = await asyncio.to_thread(run_data_task)
+        elif mode == "fast":
+            state.pipeline_mode = "fast"
+            if speculative:
+                # Hedge: the two-stage analyzer runs alongside, so a fallback doesn't start from zero
+                content_task = asyncio.ensure_future(run_content_task())
+            state.performance_data, state.performance_breakdown = await asyncio.to_thread(run_data_task)
+            # Metrics are ready: start the combined coordinator call right away
+            combined = await run_combined_task()
+            if combined is not None:
+                if content_task is not None:
+                    content_task.cancel()
+                scan = scan_transcript(
+                    state.influencer_transcript, active_policy.compliance_phrases,
+                    active_policy.forbidden_topics, policy_id=active_policy.policy_id
+                )
+                state.content_analysis = ContentMetrics.model_validate(merge_scan_into_analysis(
+                    combined.content_analysis.model_dump(), scan, state.influencer_transcript
+                ))
+                state.final_strategic_review = combined.strategic_review
+                if not state.errors:
+                    await _memo_set_async(state, "fast_content", state.content_analysis.model_dump(mode="json"))
+                    _review_fingerprint(state, f"combined:{get_runtime().rca.fast_model_pool.model_name}")
+                    await _memo_set_async(state, "review", state.final_strategic_review)
+                print("   [Fast] ✅ Combined output validated.")
+                total_time = _record_timings(state, start_total)
+                print(f"--- 🏁 Workflow Finished in {total_time:.2f}s ---\n")
+                _persist(state)
+                return state
+            print("   [Fast] ↩️  Falling back to the two-stage pipeline.")
+            registry.inc("fast_mode_fallbacks_total")
+            state.pipeline_mode = "fast_fallback"
+            state.content_analysis = await (content_task if content_task is not None else run_content_task())
+        else:
+            content_result, data_result = await asyncio.gather(
+                run_content_task(),
+                # CSV parsing is CPU work, so it still runs on a thread
+                asyncio.to_thread(run_data_task)
+            )
+            # Update State
+            state.content_analysis = content_result
+            state.performance_data, state.performance_breakdown = data_result
         print("   [Map] ✅ Parallel tasks complete.")
     except Exception as e:
+        if content_task is not None:
+            content_task.cancel()
         state.errors.append(f"Map Phase Error: {str(e)}")
+        _record_timings(state, start_total)
+        _persist(state)
         return state
 
     # 3. Strategic Review (The "Reduce" Step)
-    print("   [Reduce] 👔 Coordinator synthesizing strategy...")
+    _review_fingerprint(state)
+    memoized_review = await _memo_get_async(state, "review")
+    if memoized_review is not None:
+        state.final_strategic_review = memoized_review
+    else:
+        print("   [Reduce] 👔 Coordinator synthesizing strategy...")
+        try:
+            # FIX 1: Convert Policy object to dict for the LLM prompt consumption
+            async with limits.coordinator:
+                with stage_timer("coordinator"):
+                    final_review = await get_runtime().rca.review_async(
+                        state.content_analysis.model_dump(), 
+                        performance_context(), 
+                        state.brand_policy.model_dump(), 
+                        state.influencer_profile.model_dump() 
+                    )
+            state.final_strategic_review = final_review
+            from agents.coordinator import is_review_error
+            if is_review_error(final_review):
+                # The coordinator reports failures as text; keep them out of the memo and surface them
+                state.errors.append(f"Reduce Phase Error: {final_review}")
+            elif final_review and not state.errors:
+                await _memo_set_async(state, "review", final_review)
+            print("   [Reduce] ✅ Synthesis complete.")
+        except Exception as e:
+            state.errors.append(f"Reduce Phase Error: {str(e)}")
+
+    total_time = _record_timings(state, start_total)
+    print(f"--- 🏁 Workflow Finished in {total_time:.2f}s ---\n")
+    
+    _persist(state)
+    return state
+
+async def run_agent_system_stream(approved_script: str, influencer_transcript: str, csv_data: str, campaign_date_str: str, influencer_data: dict, limits: Optional[ConcurrencyLimits] = None, csv_stream: Optional[BinaryIO] = None, group_by: Optional[str] = None, brand: Optional[str] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Standard two-stage pipeline as a stream of (event, payload) pairs:
+    "policy", then "metrics" / "content_analysis" in completion order, then one
+    "review_delta" per coordinator chunk as the model generates it, and finally "done"
+    with the full AgentState. A failure yields "error" followed by "done".
+
+    Streams aren't shareable, so unlike run_agent_system there is no single-flight dedup.
+    Stages are memoized as in run_agent_system (INCREMENTAL_ANALYSIS); a reused review
+    arrives as a single "review_delta".
+    """
+    print("\n--- 🚀 Starting Streamed Orchestration ---")
+    start_total = time.time()
+    limits = limits or default_limits
+    start_request_timings()
+    
+    state, active_policy = await _initialize(approved_script, influencer_transcript, csv_data, campaign_date_str, influencer_data, csv_stream, group_by, "standard", _incremental_default(), brand)
+    if active_policy is None:
+        yield "error", {"message": state.errors[0]}
+        yield "done", state.model_dump(mode="json")
+        return
+    yield "policy", active_policy.model_dump(mode="json")
+
+    # 2. Map: emit each stage the moment it lands
+    content_task = asyncio.ensure_future(_content_stage(state, active_policy, limits))
+    data_task = asyncio.ensure_future(asyncio.to_thread(_metrics_stage, state, csv_stream, group_by))
+    pending = {content_task, data_task}
     try:
-        # FIX 1: Convert Policy object to dict for the LLM prompt consumption
-        final_review = await asyncio.to_thread(
-            rca.review, 
-            state.content_analysis, 
-            state.performance_data.model_dump(), 
-            state.brand_policy.model_dump(), 
-            state.influencer_profile.model_dump() 
-        )
-        state.final_strategic_review = final_review
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is data_task:
+                    state.performance_data, state.performance_breakdown = task.result()
+                    yield "metrics", _performance_context(state)
+                else:
+                    state.content_analysis = task.result()
+                    yield "content_analysis", state.content_analysis.model_dump(mode="json")
+    except Exception as e:
+        for task in pending:
+            task.cancel()
+        state.errors.append(f"Map Phase Error: {str(e)}")
+        _record_timings(state, start_total)
+        _persist(state)
+        yield "error", {"message": state.errors[-1]}
+        yield "done", state.model_dump(mode="json")
+        return
+    finally:
+        # Client disconnected (generator closed) or a stage failed: don't leave the other running
+        for task in pending:
+            task.cancel()
+
+    # 3. Reduce: forward the review as it is generated (or in one piece, if memoized)
+    _review_fingerprint(state)
+    memoized_review = await _memo_get_async(state, "review")
+    if memoized_review is not None:
+        state.final_strategic_review = memoized_review
+        yield "review_delta", {"text": memoized_review}
+        total_time = _record_timings(state, start_total)
+        print(f"--- 🏁 Streamed Workflow Finished in {total_time:.2f}s ---\n")
+        _persist(state)
+        yield "done", state.model_dump(mode="json")
+        return
+
+    print("   [Reduce] 👔 Coordinator streaming strategy...")
+    chunks = []
+    try:
+        async with limits.coordinator:
+            with stage_timer("coordinator"):
+                async for chunk in get_runtime().rca.review_stream_async(
+                    state.content_analysis.model_dump(), 
+                    _performance_context(state), 
+                    state.brand_policy.model_dump(), 
+                    state.influencer_profile.model_dump() 
+                ):
+                    chunks.append(chunk)
+                    yield "review_delta", {"text": chunk}
+        state.final_strategic_review = "".join(chunks)
+        if state.final_strategic_review and not state.errors:
+            await _memo_set_async(state, "review", state.final_strategic_review)
         print("   [Reduce] ✅ Synthesis complete.")
     except Exception as e:
+        state.final_strategic_review = "".join(chunks) or None
         state.errors.append(f"Reduce Phase Error: {str(e)}")
+        yield "error", {"message": state.errors[-1]}
 
+    total_time = _record_timings(state, start_total)
+    print(f"--- 🏁 Streamed Workflow Finished in {total_time:.2f}s ---\n")
+    _persist(state)
+    yield "done", state.model_dump(mode="json")
+
+def _record_timings(state: AgentState, start_total: float) -> float:
+    """Closes out the per-request breakdown (if instrumentation is on) and returns total seconds."""
     total_time = time.time() - start_total
-    print(f"--- 🏁 Workflow Finished in {total_time:.2f}s ---\n")
-    
-    return state
+    registry.observe("stage_duration_seconds", total_time, stage="total")
+    timings = current_timings()
+    if timings is not None:
+        state.timings = {**timings, "total": round(total_time, 4)}
+    return total_time
+
+def _persist(state: AgentState) -> None:
+    """Queues the finished state for the results store; never blocks the request."""
+    results_store = get_runtime().results_store
+    if results_store is not None:
+        results_store.save_in_background(state)
+
+async def run_agent_system_batch(campaigns: Iterable[dict], max_in_flight: Optional[int] = None, limits: Optional[ConcurrencyLimits] = None) -> AsyncIterator[Tuple[int, AgentState]]:
+    """
+    Fans a batch of campaigns out through run_agent_system and yields (index, state)
+    pairs in completion order. At most `max_in_flight` campaigns are scheduled at once
+    (campaigns are pulled lazily from the iterable); model calls are further bounded
+    by the per-model semaphores in `limits`.
+
+    Each campaign dict uses the run_agent_system argument names:
+    approved_script, influencer_transcript, csv_data, campaign_date, influencer_profile
+    (plus optional group_by, mode and brand).
+    """
+    max_in_flight = max_in_flight or int(os.getenv("BATCH_MAX_IN_FLIGHT", "32"))
+    limits = limits or default_limits
+
+    async def run_one(index: int, campaign: dict) -> Tuple[int, AgentState]:
+        try:
+            state = await run_agent_system(
+                campaign["approved_script"],
+                campaign["influencer_transcript"],
+                campaign["csv_data"],
+                campaign["campaign_date"],
+                campaign["influencer_profile"],
+                limits=limits,
+                group_by=campaign.get("group_by"),
+                mode=campaign.get("mode"),
+                brand=campaign.get("brand"),
+            )
+        except Exception as e:
+            state = AgentState(
+                approved_script="", influencer_transcript="", csv_data="", errors=[f"Batch Item Failed: {e}"],
+                campaign_date=date.today(),
+                influencer_profile=InfluencerProfile(id="", name="", archetypes=[])
+            )
+        return index, state
+
+    source = iter(enumerate(campaigns))
+    pending = set()
+    try:
+        while True:
+            for index, campaign in source:
+                pending.add(asyncio.create_task(run_one(index, campaign)))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Consumer went away (e.g. client disconnected mid-stream): stop the remaining work
+        for task in pending:
+            task.cancel()
 
 # Entry Point for Local Testing
 if __name__ == "__main__":
@@ -134,8 +749,8 @@ if __name__ == "__main__":
     print(f"Errors: {result.errors}")
     
     # Displaying the adherence check results
-    if result.content_analysis and result.content_analysis.get('deviation_summary'):
-        print(f"Risk Check: {result.content_analysis['deviation_summary']}")
+    if result.content_analysis and result.content_analysis.deviation_summary:
+        print(f"Risk Check: {result.content_analysis.deviation_summary}")
         
     if result.final_strategic_review:
         print(result.final_strategic_review[:400] + "...\n(truncated)")
\ No newline at end of file
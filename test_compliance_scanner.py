@@ -0,0 +1,37 @@
+from tools.compliance_scanner import ComplianceScanner
+
+
+def test_overlapping_compliance_phrases_are_all_found():
+    scanner = ComplianceScanner(["not financial advice", "financial advice"], [])
+    scan = scanner.scan("Quick reminder: this is not financial advice, talk to a loan officer.")
+
+    assert {hit.phrase for hit in scan.matched_phrases} == {"not financial advice", "financial advice"}
+    assert scan.missing_phrases == []
+    assert not scan.hard_fail
+
+
+def test_phrase_overlapping_a_forbidden_topic_is_reported_on_both_sides():
+    scanner = ComplianceScanner(["guaranteed approval process"], ["guaranteed approval"])
+    scan = scanner.scan("Ask about our guaranteed approval process today.")
+
+    assert [hit.phrase for hit in scan.matched_phrases] == ["guaranteed approval process"]
+    assert [hit.phrase for hit in scan.forbidden_hits] == ["guaranteed approval"]
+
+
+def test_phrases_match_whole_tokens_regardless_of_case_and_punctuation():
+    scanner = ComplianceScanner(["NMLS #12345", "Equal Housing Lender"], ["crypto"])
+    scan = scanner.scan("nmls-12345. EQUAL housing, lender! Cryptocurrency talk is fine.")
+
+    assert [hit.text for hit in scan.matched_phrases] == ["nmls-12345", "EQUAL housing, lender"]
+    assert scan.forbidden_hits == []
+    assert not scan.hard_fail
+
+
+def test_shared_prefixes_and_repeats_are_found_in_one_pass():
+    scanner = ComplianceScanner(["rate lock", "rate lock guarantee"], ["lock guarantee"])
+    scan = scanner.scan("A rate lock. Then a rate lock guarantee, and another rate lock.")
+
+    assert [(hit.phrase, hit.start) for hit in scan.matched_phrases] == [
+        ("rate lock", 2), ("rate lock", 20), ("rate lock guarantee", 20), ("rate lock", 53),
+    ]
+    assert [hit.text for hit in scan.forbidden_hits] == ["lock guarantee"]
@@ -0,0 +1,60 @@
+import asyncio
+import random
+
+import pytest
+
+import main_graph
+from benchmarks.fake_genai import FakeBackend, LatencyModel, install
+from benchmarks.synthetic import make_campaign, make_leads_csv
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setenv("ANALYSIS_CACHE_DISABLED", "false")
+    main_graph.shutdown_runtime()
+    with install(FakeBackend(latency=LatencyModel(0.001, 0.0))) as backend:
+        yield backend
+        main_graph.shutdown_runtime()
+
+
+def test_standard_run_does_not_reuse_fast_mode_outputs(backend):
+    campaign = make_campaign(random.Random(1), 0, make_leads_csv(200), campaign_date="2024-03-15")
+    coordinator_model = main_graph.get_runtime().rca.model.model_name
+
+    fast = asyncio.run(main_graph.run_agent_system(**campaign, mode="fast", incremental=True))
+    assert fast.pipeline_mode == "fast"
+    assert not fast.errors
+
+    backend.reset()
+    standard = asyncio.run(main_graph.run_agent_system(**campaign, mode="standard", incremental=True))
+
+    assert not standard.errors
+    assert standard.reused_stages == ["metrics"]
+    assert backend.calls.get(coordinator_model, 0) == 1
+
+
+def test_fast_run_reuses_standard_content(backend):
+    campaign = make_campaign(random.Random(2), 0, make_leads_csv(200), campaign_date="2024-03-15")
+
+    asyncio.run(main_graph.run_agent_system(**campaign, mode="standard", incremental=True))
+    fast = asyncio.run(main_graph.run_agent_system(**campaign, mode="fast", incremental=True))
+
+    assert not fast.errors
+    assert sorted(fast.reused_stages) == ["content", "metrics", "review"]
+
+
+def test_failed_rate_lookup_falls_back_to_the_rate_tool(backend, monkeypatch):
+    from tools.finance_tools import rate_cache
+
+    def fail(loan_type):
+        raise ValueError(f"No fixture rate for {loan_type}")
+
+    monkeypatch.setattr(rate_cache, "get", fail)
+    campaign = make_campaign(random.Random(3), 0, make_leads_csv(50), campaign_date="2024-03-15")
+    campaign["influencer_transcript"] += " Today's mortgage rate makes your monthly payment lower."
+
+    state = asyncio.run(main_graph.run_agent_system(**campaign, incremental=True))
+
+    assert not state.errors
+    assert "content" in state.stage_fingerprints
+    assert state.content_analysis.deviation_summary is not None
@@ -0,0 +1,31 @@
+import asyncio
+
+from agents.llm_client import LLMClient
+
+
+def test_models_have_no_rate_limit_unless_configured(monkeypatch):
+    monkeypatch.delenv("LLM_DEFAULT_RPM", raising=False)
+    monkeypatch.setenv("LLM_MODEL_LIMITS", '{"gemini-2.5-pro": {"rpm": 150}}')
+    client = LLMClient.from_env()
+
+    assert client._guard("gemini-2.5-flash").bucket is None
+    assert client._guard("gemini-2.5-pro").bucket.rate == 2.5
+    assert asyncio.run(client.call_async("gemini-2.5-flash", lambda: asyncio.sleep(0, "ok"))) == "ok"
+
+
+def test_default_rpm_applies_to_every_model(monkeypatch):
+    monkeypatch.setenv("LLM_DEFAULT_RPM", "120")
+    monkeypatch.delenv("LLM_MODEL_LIMITS", raising=False)
+
+    assert LLMClient.from_env()._guard("gemini-2.5-flash").bucket.rate == 2.0
+
+
+def test_async_slots_are_per_event_loop():
+    guard = LLMClient(default_concurrency=2)._guard("m")
+
+    async def slots():
+        return guard.async_slots(), guard.async_slots()
+
+    first, second = asyncio.run(slots()), asyncio.run(slots())
+    assert first[0] is first[1]
+    assert first[0] is not second[0]
@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+from tools import metrics_engine
+from tools.metrics_engine import (
+    calculate_campaign_metrics, calculate_campaign_metrics_from_file, calculate_grouped_metrics,
+    compute_metrics, compute_metrics_from_path,
+)
+
+CSV = (
+    "Date,New Leads,SignOffs,Closes\n"
+    "2024-03-01,10,2,1\n"
+    "2024-03-01,5,,2\n"
+    "2024-03-02,7,1,\n"
+)
+
+
+def totals(metrics):
+    return metrics.raw_lead_count, metrics.lost_leads, metrics.closed_count
+
+
+def chunked(csv_data: str, chunk_rows: int = 1):
+    """The pandas path, forced even for a tiny file (no size hint)."""
+    return calculate_campaign_metrics_from_file(io.BytesIO(csv_data.encode("utf-8")), chunk_rows=chunk_rows)
+
+
+def test_small_and_chunked_paths_agree_with_blank_cells():
+    assert totals(calculate_campaign_metrics(CSV)) == (22, 3, 3)
+    assert totals(chunked(CSV)) == (22, 3, 3)
+
+
+def test_counts_past_int32_are_not_wrapped():
+    csv_data = "New Leads,SignOffs,Closes\n3000000000,1,1\n2,1,1\n"
+
+    assert totals(calculate_campaign_metrics(csv_data)) == (3000000002, 2, 2)
+    assert totals(chunked(csv_data)) == (3000000002, 2, 2)
+
+
+def test_counts_past_int64_take_the_fallback_instead_of_wrapping():
+    csv_data = "New Leads,SignOffs,Closes\n9223372036854775808,0,0\n"
+
+    assert chunked(csv_data).raw_lead_count == 9223372036854775808
+
+
+def test_non_integer_cells_take_the_fallback():
+    csv_data = "New Leads,SignOffs,Closes\n1.5,0,0\n2.5,1,1\n"
+
+    assert totals(calculate_campaign_metrics(csv_data)) == (4, 1, 1)
+    assert totals(chunked(csv_data)) == (4, 1, 1)
+
+
+def test_bom_and_reordered_columns():
+    csv_data = "\ufeffCloses, SignOffs ,Date,New Leads\n1,2,2024-03-01,10\n2,0,2024-03-02,5\n"
+
+    assert totals(calculate_campaign_metrics(csv_data)) == (15, 2, 3)
+    assert totals(chunked(csv_data)) == (15, 2, 3)
+
+
+def test_large_in_memory_csv_uses_the_chunked_path(monkeypatch):
+    monkeypatch.setattr(metrics_engine, "SMALL_CSV_BYTES", 10)
+    monkeypatch.setattr(metrics_engine, "CSV_CHUNK_ROWS", 2)
+
+    assert totals(calculate_campaign_metrics(CSV)) == (22, 3, 3)
+
+
+def test_grouped_totals_match_and_file_path(tmp_path):
+    breakdown = calculate_grouped_metrics(CSV, "Date")
+    assert breakdown.keys == ["2024-03-01", "2024-03-02"]
+    assert breakdown.raw_lead_count == [15, 7]
+
+    path = tmp_path / "leads.csv"
+    path.write_text(CSV, encoding="utf-8-sig")
+    performance, grouped = compute_metrics_from_path(str(path), "Date")
+    assert totals(performance) == (22, 3, 3)
+    assert grouped == breakdown
+    assert totals(compute_metrics_from_path(str(path))[0]) == (22, 3, 3)
+
+
+def test_missing_column_is_reported():
+    with pytest.raises(ValueError, match="missing required columns"):
+        compute_metrics("New Leads,Closes\n1,1\n")
@@ -0,0 +1,47 @@
+import json
+
+from tools.policy_manager import PolicyManager
+
+
+def policy(policy_id, start, end, brand=None):
+    return {
+        "policy_id": policy_id, "name": policy_id, "brand": brand, "start_date": start, "end_date": end,
+        "market_trigger": "Stable Rates", "focus_phrases": ["fresh start"],
+    }
+
+
+def test_windows_may_overlap_across_brands_and_are_looked_up_per_brand(tmp_path):
+    path = tmp_path / "policies.json"
+    path.write_text(json.dumps([
+        policy("POL-1", "2024-01-01", "2024-01-31"),
+        policy("ACME-1", "2024-01-10", "2024-02-10", brand="acme"),
+        policy("ZETA-1", "2024-01-05", "2024-01-20", brand="zeta"),
+    ]))
+    manager = PolicyManager(str(path))
+
+    assert manager.get_policy_for_date("2024-01-15").policy_id == "POL-1"
+    assert manager.get_policy_for_date("2024-01-15", brand="acme").policy_id == "ACME-1"
+    assert [p and p.policy_id for p in manager.get_policies_for_dates(["2024-01-06", "2024-01-25"], brand="zeta")] == ["ZETA-1", None]
+    assert manager.get_policy_for_date("2024-01-15", brand="unknown") is None
+
+
+def test_overlap_within_a_brand_keeps_the_index_empty(tmp_path):
+    path = tmp_path / "policies.json"
+    path.write_text(json.dumps([
+        policy("ACME-1", "2024-01-01", "2024-01-31", brand="acme"),
+        policy("ACME-2", "2024-01-15", "2024-02-15", brand="acme"),
+    ]))
+
+    assert PolicyManager(str(path)).get_policy_for_date("2024-01-10", brand="acme") is None
+
+
+def test_run_looks_up_the_requested_brand():
+    import asyncio
+    from main_graph import run_agent_system
+
+    state = asyncio.run(run_agent_system(
+        "script", "transcript", "Date,Leads\n2024-01-15,3\n", "2024-01-15",
+        {"id": "INF-1", "name": "A", "archetypes": []}, brand="no-such-brand", incremental=False,
+    ))
+
+    assert state.errors == ["Initialization Failed: No active Brand Policy found for date 2024-01-15 (brand 'no-such-brand')"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from main_graph import SingleFlight
+from tools.models import AgentState
+
+
+def make_state() -> AgentState:
+    return AgentState.model_validate({
+        "approved_script": "script", "influencer_transcript": "transcript", "csv_data": "",
+        "campaign_date": "2024-03-15", "influencer_profile": {"id": "INF-1", "name": "A", "archetypes": []},
+    })
+
+
+def test_identical_calls_share_one_run():
+    async def scenario():
+        flights, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return make_state()
+
+        first, second = await asyncio.gather(flights.run("k", work), flights.run("k", work))
+        return flights, calls, first, second
+
+    flights, calls, first, second = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first == second and first is not second
+    assert flights.in_flight() == 0
+
+
+def test_errors_reach_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(flights.run("k", work), flights.run("k", work), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+
+
+def test_retry_after_last_waiter_cancels_starts_a_new_run():
+    async def scenario():
+        flights, started = SingleFlight(), []
+
+        async def work():
+            started.append(1)
+            await asyncio.sleep(0.05)
+            return make_state()
+
+        abandoned = asyncio.ensure_future(flights.run("k", work))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await abandoned
+        # Retry straight away, before the cancelled task has finished unwinding
+        retried = await flights.run("k", work)
+        return started, retried
+
+    started, retried = asyncio.run(scenario())
+    assert len(started) == 2
+    assert retried.approved_script == "script"
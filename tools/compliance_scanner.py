@@ -0,0 +1,167 @@
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from tools.models import ComplianceScan, PhraseMatch
+
+# Anything that is not a letter or digit counts as a separator, so
+# "NMLS #12345", "nmls 12345" and "NMLS-#12345" all normalize to the same tokens.
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_SENTENCE_END_RE = re.compile(r"[.!?\n]")
+
+
+class ComplianceScanner:
+    """
+    Aho-Corasick automaton over the normalized token stream: every compliance phrase and
+    forbidden topic is a sequence of lowercased tokens, and one pass over the transcript's
+    tokens reports all of them, overlapping ones included ("financial advice" inside "not
+    financial advice"). Matching is case-insensitive and ignores punctuation/whitespace
+    differences between words; a phrase only matches whole tokens.
+    """
+
+    def __init__(self, compliance_phrases: List[str], forbidden_topics: List[str]):
+        self.compliance_phrases = list(compliance_phrases)
+        self.forbidden_topics = list(forbidden_topics)
+        # Trie over tokens: per node its transitions, failure link and (kind, phrase, token count) outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str, int]]] = [[]]
+        self._longest = 1
+        for kind, phrases in (("c", self.compliance_phrases), ("f", self.forbidden_topics)):
+            for phrase in phrases:
+                tokens = _TOKEN_RE.findall(phrase.lower())
+                if tokens:
+                    self._add(tokens, (kind, phrase, len(tokens)))
+                    self._longest = max(self._longest, len(tokens))
+        self._link()
+
+    def _add(self, tokens: List[str], output: Tuple[str, str, int]) -> None:
+        node = 0
+        for token in tokens:
+            nxt = self._goto[node].get(token)
+            if nxt is None:
+                nxt = self._goto[node][token] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(output)
+
+    def _link(self) -> None:
+        """Breadth-first failure links; each node also inherits the outputs of its failure node."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def scan(self, transcript: str) -> ComplianceScan:
+        matched: List[PhraseMatch] = []
+        forbidden: List[PhraseMatch] = []
+        # Offsets of the last few tokens, enough to find where the longest phrase started
+        spans: "deque[Tuple[int, int]]" = deque(maxlen=self._longest)
+        # Where each phrase's last hit ended: repeats of one phrase don't overlap each other
+        last_end: Dict[Tuple[str, str], int] = {}
+        node = 0
+        for m in _TOKEN_RE.finditer(transcript):
+            token = m.group().lower()
+            spans.append(m.span())
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for kind, phrase, length in self._out[node]:
+                start, end = spans[-length][0], m.end()
+                if start < last_end.get((kind, phrase), 0):
+                    continue
+                last_end[(kind, phrase)] = end
+                hit = PhraseMatch(phrase=phrase, start=start, end=end, text=transcript[start:end])
+                (matched if kind == "c" else forbidden).append(hit)
+        # Hits come out in order of where they end; report them in transcript order
+        matched.sort(key=lambda hit: (hit.start, hit.end))
+        forbidden.sort(key=lambda hit: (hit.start, hit.end))
+
+        found = {hit.phrase for hit in matched}
+        missing = [p for p in self.compliance_phrases if p not in found]
+        return ComplianceScan(
+            matched_phrases=matched,
+            missing_phrases=missing,
+            forbidden_hits=forbidden,
+            hard_fail=bool(missing or forbidden),
+        )
+
+
+_CACHE_SIZE = 256
+_scanners: "OrderedDict[Tuple, ComplianceScanner]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_scanner(policy_id: Optional[str], compliance_phrases: List[str], forbidden_topics: List[str]) -> ComplianceScanner:
+    """
+    Compiled scanners are cached per policy. The phrase lists are part of the key so
+    a hot-reloaded policy that keeps its policy_id still gets a fresh automaton.
+    """
+    key = (policy_id, tuple(compliance_phrases), tuple(forbidden_topics))
+    with _lock:
+        scanner = _scanners.get(key)
+        if scanner is not None:
+            _scanners.move_to_end(key)
+            return scanner
+    scanner = ComplianceScanner(compliance_phrases, forbidden_topics)
+    with _lock:
+        _scanners[key] = scanner
+        while len(_scanners) > _CACHE_SIZE:
+            _scanners.popitem(last=False)
+    return scanner
+
+
+def scan_transcript(transcript: str, compliance_phrases: List[str], forbidden_topics: List[str], policy_id: Optional[str] = None) -> ComplianceScan:
+    return get_scanner(policy_id, compliance_phrases, forbidden_topics).scan(transcript)
+
+
+def sentence_at(text: str, start: int, end: int) -> str:
+    """The sentence surrounding a match, for deviation_summary entries."""
+    left = max((m.end() for m in _SENTENCE_END_RE.finditer(text, 0, start)), default=0)
+    right_match = _SENTENCE_END_RE.search(text, end)
+    right = right_match.end() if right_match else len(text)
+    return text[left:right].strip()
+
+
+def merge_scan_into_analysis(analysis: dict, scan: ComplianceScan, transcript: str) -> dict:
+    """
+    Deterministic results override whatever the LLM reported for the same checks:
+    the scan is attached verbatim, and any forbidden sentence the model missed is
+    appended to deviation_summary.
+    """
+    merged = dict(analysis)
+    deviations = list(merged.get("deviation_summary") or [])
+    for phrase in scan.missing_phrases:
+        note = f"Missing mandatory phrase: {phrase}"
+        if note not in deviations:
+            deviations.append(note)
+    for hit in scan.forbidden_hits:
+        sentence = sentence_at(transcript, hit.start, hit.end)
+        if sentence and sentence not in deviations:
+            deviations.append(sentence)
+    merged["deviation_summary"] = deviations
+    merged["compliance_scan"] = scan.model_dump()
+    return merged
+
+
+def hard_fail_analysis(scan: ComplianceScan, transcript: str) -> dict:
+    """A ContentMetrics-shaped record for transcripts rejected before the LLM call."""
+    return merge_scan_into_analysis(
+        {
+            "tone_score": 0,
+            "hook_strength": "Low",
+            "key_themes": ["COMPLIANCE_FAIL"],
+            "rate_check": "Not Applicable",
+            "deviation_summary": [],
+        },
+        scan,
+        transcript,
+    )
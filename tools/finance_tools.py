@@ -1,19 +1,190 @@
 # tools/finance_tools.py
+import json
+import os
 import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from tools.instrumentation import registry, stage_timer
+
+
+class RateProvider(ABC):
+    """Interface for a mortgage-rate feed. fetch() may block on the network; callers go through RateCache."""
+
+    @abstractmethod
+    def fetch(self, loan_type: str) -> dict:
+        """The current rate for `loan_type` as a dict (loan_type, rate_percentage, trend, timestamp)."""
+
+
+class MockRateProvider(RateProvider):
+    """The original simulated feed (6.5% - 7.5%, random per fetch)."""
+
+    def fetch(self, loan_type: str) -> dict:
+        # MOCK: Simulating a live API call (e.g., 6.5% - 7.5%)
+        base_rate = 6.5 + (random.random() * 1.0)
+        return {
+            "loan_type": loan_type,
+            "rate_percentage": round(base_rate, 2),
+            "trend": "stable",
+            "timestamp": datetime.now(timezone.utc).date().isoformat()
+        }
+
+
+class FixtureRateProvider(RateProvider):
+    """
+    Deterministic offline provider. Rates come from a dict or a JSON file mapping
+    loan_type -> rate (or -> a full response dict), so tests and benchmarks never hit a feed.
+    """
+
+    DEFAULT_RATES = {"30_year_fixed": 6.85, "15_year_fixed": 6.1, "5_1_arm": 6.4}
+
+    def __init__(self, rates: Optional[Dict[str, object]] = None, path: Optional[str] = None):
+        if path:
+            with open(path, "r") as f:
+                rates = json.load(f)
+        self.rates = rates if rates is not None else dict(self.DEFAULT_RATES)
+
+    def fetch(self, loan_type: str) -> dict:
+        if loan_type not in self.rates:
+            raise ValueError(f"No fixture rate for loan type '{loan_type}'")
+        entry = self.rates[loan_type]
+        if isinstance(entry, dict):
+            return {"loan_type": loan_type, **entry}
+        return {
+            "loan_type": loan_type,
+            "rate_percentage": float(entry),
+            "trend": "stable",
+            "timestamp": "fixture"
+        }
+
+
+class RateCache:
+    """
+    Process-wide TTL cache per loan_type in front of a RateProvider.
+
+    Fresh entries are returned directly. Stale entries are still returned immediately while a
+    refresh runs in the background (stale-while-revalidate), and the optional refresher thread
+    keeps known loan types warm, so the tool call on the LLM hot path only touches the feed on
+    the very first lookup of a loan type.
+    """
+
+    def __init__(self, provider: RateProvider, ttl_seconds: float = 300.0):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def set_provider(self, provider: RateProvider) -> None:
+        with self._lock:
+            self.provider = provider
+            self._entries.clear()
+
+    def _fetch(self, loan_type: str) -> dict:
+        with stage_timer("rate_feed"):
+            rate = self.provider.fetch(loan_type)
+        with self._lock:
+            self._entries[loan_type] = (time.monotonic(), rate)
+        registry.inc("rate_feed_fetches_total", loan_type=loan_type)
+        return rate
+
+    def _refresh_in_background(self, loan_type: str) -> None:
+        with self._lock:
+            if loan_type in self._refreshing:
+                return
+            self._refreshing.add(loan_type)
+
+        def run():
+            try:
+                self._fetch(loan_type)
+            except Exception as e:
+                print(f"   [RATES] ⚠️  Background refresh of {loan_type} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(loan_type)
+
+        threading.Thread(target=run, name=f"rate-refresh-{loan_type}", daemon=True).start()
+
+    def get(self, loan_type: str) -> dict:
+        with self._lock:
+            entry = self._entries.get(loan_type)
+        if entry is None:
+            # Cold miss: the only case that waits on the provider
+            registry.inc("rate_cache_lookups_total", result="miss")
+            return self._fetch(loan_type)
+        fetched_at, rate = entry
+        if time.monotonic() - fetched_at > self.ttl_seconds:
+            registry.inc("rate_cache_lookups_total", result="stale")
+            self._refresh_in_background(loan_type)
+        else:
+            registry.inc("rate_cache_lookups_total", result="hit")
+        return rate
+
+    def start_refresher(self, loan_types: Iterable[str] = ("30_year_fixed",), interval: Optional[float] = None) -> None:
+        """Warms the given loan types now and re-fetches them every `interval` seconds (default: half the TTL)."""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        loan_types = list(loan_types)
+        interval = interval or self.ttl_seconds / 2
+        self._stop.clear()
+
+        def loop():
+            while True:
+                known = set(loan_types)
+                with self._lock:
+                    known.update(self._entries)
+                for loan_type in known:
+                    try:
+                        self._fetch(loan_type)
+                    except Exception as e:
+                        print(f"   [RATES] ⚠️  Refresh of {loan_type} failed: {e}")
+                if self._stop.wait(interval):
+                    return
+
+        self._refresher = threading.Thread(target=loop, name="rate-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self) -> None:
+        self._stop.set()
+
+
+def _provider_from_env() -> RateProvider:
+    """RATE_PROVIDER=mock (default) or fixture (optionally with RATE_FIXTURE_PATH)."""
+    kind = os.getenv("RATE_PROVIDER", "mock").lower()
+    if kind == "fixture":
+        return FixtureRateProvider(path=os.getenv("RATE_FIXTURE_PATH") or None)
+    return MockRateProvider()
+
+
+rate_cache = RateCache(_provider_from_env(), ttl_seconds=float(os.getenv("RATE_CACHE_TTL_SECONDS", "300")))
+
 
 def get_current_mortgage_rate(loan_type: str = "30_year_fixed"):
     """
     Fetches the current national average mortgage rate.
     Use this tool when the script mentions rates, payments, or market conditions.
     """
-    # MOCK: Simulating a live API call (e.g., 6.5% - 7.5%)
-    base_rate = 6.5 + (random.random() * 1.0)
-    
-    print(f"   [TOOL] 🛠️  Agent is looking up {loan_type} rates...")
-    
-    return {
-        "loan_type": loan_type,
-        "rate_percentage": round(base_rate, 2),
-        "trend": "stable",
-        "timestamp": "2025-11-18"
-    }
\ No newline at end of file
+    registry.inc("tool_calls_total", tool="get_current_mortgage_rate")
+    with stage_timer("tool_call"):
+        try:
+            return rate_cache.get(loan_type)
+        except Exception as e:
+            # Returned to the model rather than raised, so one bad lookup doesn't sink the analysis
+            return {"loan_type": loan_type, "error": f"Rate lookup failed: {e}"}
+
+
+# Local stand-in for the model's own "does this mention rates?" judgement
+_RATE_MENTION_RE = re.compile(
+    r"\b(rates?|apr|interest|payments?|monthly|refinanc\w*|points)\b|\d+(\.\d+)?\s*%",
+    re.IGNORECASE
+)
+
+
+def mentions_rates_or_payments(*texts: str) -> bool:
+    """True if any text mentions rates or payments, i.e. the analyzer would call the rate tool."""
+    return any(_RATE_MENTION_RE.search(t) for t in texts if t)
@@ -0,0 +1,37 @@
+import hashlib
+import json
+from typing import Any
+
+
+def _default(obj: Any) -> Any:
+    # Pydantic models hash by their field values, everything else by str()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    return str(obj)
+
+
+def stable_hash(*parts: Any) -> str:
+    """
+    Content-addressed key for arbitrary JSON-friendly inputs.
+    Dicts are serialized with sorted keys so logically equal inputs hash the same.
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=_default, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(fileobj, chunk_size: int = 1024 * 1024) -> str:
+    """
+    sha256 of a binary file object, read in chunks and rewound afterwards.
+    Matches sha256(text.encode("utf-8")) for the decoded contents, so streamed and
+    in-memory CSVs fingerprint identically.
+    """
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        h.update(chunk)
+    fileobj.seek(0)
+    return h.hexdigest()
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
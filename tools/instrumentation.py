@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Set METRICS_ENABLED=false to turn every hook below into a no-op.
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Per-request stage timings; the dict is shared by tasks/threads spawned from the request
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Minimal in-process counters/histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        # Called at scrape time, each returns (name, labels, value) gauge samples
+        self._collectors: List[Callable[[], List[Tuple[str, Dict[str, str], float]]]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(DEFAULT_BUCKETS)
+            hist.observe(value)
+
+    def register_collector(self, collector: Callable[[], List[Tuple[str, Dict[str, str], float]]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def fmt(labels: Dict[str, str]) -> str:
+            if not labels:
+                return ""
+            inner = ",".join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+            return "{" + inner + "}"
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{fmt(dict(key))} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    labels = dict(key)
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt({**labels, 'le': str(bound)})} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt({**labels, 'le': '+Inf'})} {hist.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist.total}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist.count}")
+
+        gauges: Dict[str, List[str]] = {}
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"   [METRICS] ⚠️  Collector failed: {e}")
+                continue
+            for name, labels, value in samples:
+                gauges.setdefault(name, []).append(f"{name}{fmt(labels)} {value}")
+        for name, samples in sorted(gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("stage_duration_seconds", "Wall time per orchestration stage.")
+registry.describe("llm_calls_total", "Model calls by model and outcome.")
+registry.describe("llm_tokens_total", "Tokens reported by the SDK usage metadata.")
+
+
+def start_request_timings() -> Optional[Dict[str, float]]:
+    """Begins a per-request timing breakdown in the current context (None when disabled)."""
+    if not ENABLED:
+        return None
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Times a block into the stage histogram and the current request's breakdown."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("stage_duration_seconds", elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            # Repeated stages (e.g. several tool calls) accumulate
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 4)
+
+
+def record_llm_call(model_name: str, response=None, outcome: str = "ok") -> None:
+    """Counts a model call and, when the response carries usage metadata, its tokens."""
+    if not ENABLED:
+        return
+    registry.inc("llm_calls_total", model=model_name, outcome=outcome)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if prompt_tokens:
+        registry.inc("llm_tokens_total", prompt_tokens, model=model_name, kind="prompt")
+    if output_tokens:
+        registry.inc("llm_tokens_total", output_tokens, model=model_name, kind="output")
+
+
+def cache_collector(name: str, stats: Callable[[], dict]) -> Callable[[], List[Tuple[str, Dict[str, str], float]]]:
+    """Adapts a ResponseCache-style stats() dict into gauge samples."""
+    def collect() -> List[Tuple[str, Dict[str, str], float]]:
+        s = stats()
+        labels = {"cache": name}
+        return [
+            ("cache_hits", labels, s.get("hits", 0)),
+            ("cache_misses", labels, s.get("misses", 0)),
+            ("cache_hit_rate", labels, s.get("hit_rate", 0.0)),
+        ]
+    return collect
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """The breakdown started by start_request_timings() in this context, if any."""
+    return _request_timings.get()
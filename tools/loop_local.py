@@ -0,0 +1,27 @@
+import asyncio
+import threading
+import weakref
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopLocal(Generic[T]):
+    """
+    One value per running event loop, built by `factory` on first use. asyncio primitives
+    belong to one loop (Python 3.10 binds them on first use), so long-lived objects that
+    outlive a loop (module-level limits, the shared LLM client) keep theirs here.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._values: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._values.get(loop)
+            if value is None:
+                value = self._values[loop] = self._factory()
+            return value
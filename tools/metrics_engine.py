@@ -1,6 +1,169 @@
-import pandas as pd
+import codecs
+import csv
 import io
-from tools.models import PerformanceMetrics
+import os
+from typing import Callable, BinaryIO, Dict, Iterable, List, Optional, TextIO, Tuple, TypeVar, Union
+from tools.models import GroupedMetrics, PerformanceMetrics
+# pandas is imported inside the chunked/grouped paths: small CSVs never need it, and
+# importing it up front is a noticeable slice of service cold start.
+
+# Phase 2 schema: the only columns we ever sum. Everything else in a CRM export is skipped at parse time.
+REQUIRED_COLUMNS = ('New Leads', 'SignOffs', 'Closes')
+
+# Below this size the stdlib csv module beats pandas' import/setup overhead.
+SMALL_CSV_BYTES = int(os.getenv("SMALL_CSV_BYTES", str(256 * 1024)))
+# Rows per pandas chunk on the streaming path; bounds peak memory regardless of file size.
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+
+T = TypeVar("T")
+
+
+def _resolve_columns(header: List[str]) -> Dict[str, int]:
+    """Maps each required column to its position. Header whitespace is ignored (messy uploads)."""
+    stripped = [c.strip() for c in header]
+    missing = set(REQUIRED_COLUMNS) - set(stripped)
+    if missing:
+        raise ValueError(f"CSV missing required columns: {missing}")
+    return {name: stripped.index(name) for name in REQUIRED_COLUMNS}
+
+
+def _to_metrics(totals: Dict[str, Union[int, float]]) -> PerformanceMetrics:
+    return PerformanceMetrics(
+        raw_lead_count=int(totals['New Leads']),
+        # In your new schema, 'SignOffs' likely represents lost leads (leads signed off/disqualified)
+        lost_leads=int(totals['SignOffs']),
+        closed_count=int(totals['Closes'])
+    )
+
+
+def _sum_rows(rows: Iterable[List[str]], positions: Dict[str, int]) -> PerformanceMetrics:
+    """Pure-Python fast path: no pandas, one pass over already-split rows."""
+    totals = {name: 0 for name in REQUIRED_COLUMNS}
+    items = list(positions.items())
+    for row in rows:
+        if not row:
+            continue
+        for name, pos in items:
+            value = row[pos].strip() if pos < len(row) else ""
+            if not value:
+                continue  # Blank cells are skipped, matching pandas' NaN-skipping sum
+            try:
+                totals[name] += int(value)
+            except ValueError:
+                totals[name] += float(value)
+    return _to_metrics(totals)
+
+
+def _checked_ints(values: T) -> T:
+    """
+    pandas wraps integers past the dtype's range instead of raising (2**63 reads back as
+    -2**63), and counts are never negative, so a negative value sends the parse to the fallback.
+    """
+    if (values < 0).any(axis=None):
+        raise OverflowError("Negative or out-of-range count in an Int64 column")
+    return values
+
+
+def _with_int_fallback(stream: TextIO, consume: Callable[[Optional[str]], T]) -> T:
+    """
+    Runs consume() with nullable Int64 parsing. Non-integer cells (e.g. "1.5") or values out of
+    Int64 range make that fail, in which case the stream is rewound past the header and
+    consumed once more with pandas' inferred dtypes.
+    """
+    try:
+        return consume("Int64")
+    except (ValueError, TypeError, OverflowError):
+        stream.seek(0)
+        stream.readline()
+        return consume(None)
+
+
+def _sum_chunks(stream: TextIO, positions: Dict[str, int], chunk_rows: int) -> PerformanceMetrics:
+    """
+    Chunked pandas path. The header has already been consumed, so columns are selected by
+    position and parsed straight into a nullable integer dtype.
+    """
+    import pandas as pd
+    columns = list(positions.values())
+
+    def consume(dtype: Optional[str]) -> Dict[str, Union[int, float]]:
+        totals = {name: 0 for name in REQUIRED_COLUMNS}
+        reader = pd.read_csv(stream, header=None, usecols=columns, dtype=dtype, skipinitialspace=True, chunksize=chunk_rows)
+        for chunk in reader:
+            if dtype is not None:
+                _checked_ints(chunk)
+            for name, pos in positions.items():
+                totals[name] += chunk[pos].sum()
+        return totals
+
+    return _to_metrics(_with_int_fallback(stream, consume))
+
+
+def _group_chunks(stream: TextIO, positions: Dict[str, int], group_pos: int, group_by: str, chunk_rows: int) -> GroupedMetrics:
+    """
+    Vectorized grouped aggregation. Each chunk is reduced with groupby().sum(); the small
+    per-chunk partials are then re-aggregated, so memory is bounded by chunk size plus the
+    number of distinct groups, not by row count.
+    """
+    import pandas as pd
+    value_cols = list(positions.values())
+
+    def consume(dtype: Optional[str]) -> "pd.DataFrame":
+        dtypes = {pos: dtype for pos in value_cols} if dtype else {}
+        # Keys stay strings so IDs like "00123" keep their leading zeros
+        dtypes[group_pos] = str
+        partials = []
+        reader = pd.read_csv(stream, header=None, usecols=value_cols + [group_pos], dtype=dtypes, skipinitialspace=True, chunksize=chunk_rows)
+        for chunk in reader:
+            values = chunk[value_cols].fillna(0).astype("float64" if dtype is None else "int64")
+            if dtype is not None:
+                _checked_ints(values)
+            keys = chunk[group_pos].fillna("").str.strip()
+            partials.append(values.groupby(keys, sort=False).sum())
+        if not partials:
+            return pd.DataFrame(columns=value_cols)
+        return pd.concat(partials).groupby(level=0, sort=True).sum()
+
+    agg = _with_int_fallback(stream, consume)
+    raw = agg[positions['New Leads']].astype("int64")
+    lost = agg[positions['SignOffs']].astype("int64")
+    closed = agg[positions['Closes']].astype("int64")
+    # Same definitions as PerformanceMetrics' properties, computed column-wise
+    qualified = raw - lost
+    win_rate = (closed / raw.where(raw != 0)).fillna(0.0).round(3)
+
+    return GroupedMetrics(
+        group_by=group_by,
+        keys=[str(k) for k in agg.index],
+        raw_lead_count=raw.tolist(),
+        lost_leads=lost.tolist(),
+        closed_count=closed.tolist(),
+        qualified_lead_count=qualified.tolist(),
+        win_rate=win_rate.tolist()
+    )
+
+
+def _resolve_group_column(header: List[str], group_by: str) -> int:
+    stripped = [c.strip() for c in header]
+    if group_by.strip() not in stripped:
+        raise ValueError(f"CSV has no '{group_by}' column to group by")
+    return stripped.index(group_by.strip())
+
+
+def _open_text(fileobj: Union[BinaryIO, TextIO]) -> TextIO:
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    # codecs reader works on any .read() object (SpooledTemporaryFile included) and drops a BOM
+    return codecs.getreader("utf-8-sig")(fileobj)
+
+
+def is_small_csv(csv_data: str) -> bool:
+    """
+    SMALL_CSV_BYTES is a byte size (uploads are classified by UploadFile.size), so text is
+    measured in UTF-8 bytes. A character is never less than a byte, so only short text needs encoding.
+    """
+    return len(csv_data) <= SMALL_CSV_BYTES and len(csv_data.encode("utf-8")) <= SMALL_CSV_BYTES
+
 
 def calculate_campaign_metrics(csv_data: str) -> PerformanceMetrics:
     """
@@ -8,32 +171,80 @@ def calculate_campaign_metrics(csv_data: str) -> PerformanceMetrics:
     the Phase 2 schema: New Leads, SignOffs, Closes.
     """
     try:
-        # Wrap string data into a file object for pandas
-        df = pd.read_csv(io.StringIO(csv_data))
-        
-        # 1. VALIDATION: Check for the new, simpler column headers
-        # Note: Pandas is case-sensitive, so we check exact matches.
-        required_cols = {'New Leads', 'SignOffs', 'Closes'} 
-        
-        if not required_cols.issubset(df.columns):
-            # Fallback check: try lowercase if the user uploaded a messy file
-            df.columns = [c.strip() for c in df.columns] # Clean whitespace
-            if not required_cols.issubset(df.columns):
-                 raise ValueError(f"CSV missing required columns: {required_cols - set(df.columns)}")
-
-        # 2. CALCULATION: Sum the columns directly (No more multiplication simulation)
-        # The CSV now contains the actual counts we want.
-        raw_leads = int(df['New Leads'].sum())
-        # In your new schema, 'SignOffs' likely represents lost leads (leads signed off/disqualified)
-        lost_leads = int(df['SignOffs'].sum()) 
-        closed_count = int(df['Closes'].sum())
-        
-        # 3. RETURN: Populate the Pydantic model
-        return PerformanceMetrics(
-            raw_lead_count=raw_leads,
-            lost_leads=lost_leads,
-            closed_count=closed_count
-        )
+        stream = io.StringIO(csv_data.lstrip("\ufeff"))
+        header = next(csv.reader([stream.readline()]), [])
+        positions = _resolve_columns(header)
+
+        if is_small_csv(csv_data):
+            return _sum_rows(csv.reader(stream), positions)
+        return _sum_chunks(stream, positions, CSV_CHUNK_ROWS)
+
+    except Exception as e:
+        raise ValueError(f"Metric Calculation Failed: {str(e)}")
+
+
+def calculate_campaign_metrics_from_file(fileobj: Union[BinaryIO, TextIO], size_hint: Optional[int] = None, chunk_rows: Optional[int] = None) -> PerformanceMetrics:
+    """
+    Streaming variant for uploads (e.g. UploadFile.file). The file is read incrementally and
+    only the required columns are parsed, so memory stays bounded by the chunk size rather
+    than the export size. Returns the same PerformanceMetrics as calculate_campaign_metrics.
+    """
+    try:
+        stream = _open_text(fileobj)
+        header = next(csv.reader([stream.readline()]), [])
+        positions = _resolve_columns(header)
+
+        if size_hint is not None and size_hint <= SMALL_CSV_BYTES:
+            return _sum_rows(csv.reader(stream), positions)
+        return _sum_chunks(stream, positions, chunk_rows or CSV_CHUNK_ROWS)
 
     except Exception as e:
-        raise ValueError(f"Metric Calculation Failed: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Metric Calculation Failed: {str(e)}")
+
+
+def calculate_grouped_metrics(csv_data: str, group_by: str) -> GroupedMetrics:
+    """Grouped mode: per-date / per-influencer / per-campaign metrics for the given CSV column."""
+    try:
+        stream = io.StringIO(csv_data.lstrip("\ufeff"))
+        header = next(csv.reader([stream.readline()]), [])
+        positions = _resolve_columns(header)
+        group_pos = _resolve_group_column(header, group_by)
+        return _group_chunks(stream, positions, group_pos, group_by.strip(), CSV_CHUNK_ROWS)
+
+    except Exception as e:
+        raise ValueError(f"Metric Calculation Failed: {str(e)}")
+
+
+def calculate_grouped_metrics_from_file(fileobj: Union[BinaryIO, TextIO], group_by: str, chunk_rows: Optional[int] = None) -> GroupedMetrics:
+    """Streaming variant of calculate_grouped_metrics for uploads."""
+    try:
+        stream = _open_text(fileobj)
+        header = next(csv.reader([stream.readline()]), [])
+        positions = _resolve_columns(header)
+        group_pos = _resolve_group_column(header, group_by)
+        return _group_chunks(stream, positions, group_pos, group_by.strip(), chunk_rows or CSV_CHUNK_ROWS)
+
+    except Exception as e:
+        raise ValueError(f"Metric Calculation Failed: {str(e)}")
+
+
+def compute_metrics(csv_data: str, fileobj: Optional[Union[BinaryIO, TextIO]] = None, group_by: Optional[str] = None) -> Tuple[PerformanceMetrics, Optional[GroupedMetrics]]:
+    """
+    Totals plus, when group_by is set, the breakdown. Reads `fileobj` when given, else `csv_data`.
+    """
+    if group_by:
+        # One grouped pass yields both the breakdown and (by summing it) the totals
+        if fileobj is not None:
+            breakdown = calculate_grouped_metrics_from_file(fileobj, group_by)
+        else:
+            breakdown = calculate_grouped_metrics(csv_data, group_by)
+        return breakdown.totals(), breakdown
+    if fileobj is not None:
+        return calculate_campaign_metrics_from_file(fileobj), None
+    return calculate_campaign_metrics(csv_data), None
+
+
+def compute_metrics_from_path(path: str, group_by: Optional[str] = None) -> Tuple[PerformanceMetrics, Optional[GroupedMetrics]]:
+    """compute_metrics() for a file on disk; the process-pool entry point (a path pickles, a file object doesn't)."""
+    with open(path, "rb") as f:
+        return compute_metrics("", f, group_by)
@@ -1,8 +1,22 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import date
 from enum import Enum
 from pydantic import BaseModel, Field
 
+# --- Gear 3: Deterministic Compliance Scan (pre-LLM) ---
+class PhraseMatch(BaseModel):
+    phrase: str = Field(..., description="The policy phrase as written in policies.json")
+    start: int = Field(..., description="Start offset in the transcript")
+    end: int = Field(..., description="End offset in the transcript (exclusive)")
+    text: str = Field(..., description="The exact transcript text that matched")
+
+class ComplianceScan(BaseModel):
+    """Exact-match results from tools/compliance_scanner.py"""
+    matched_phrases: List[PhraseMatch] = Field(default_factory=list)
+    missing_phrases: List[str] = Field(default_factory=list, description="Mandatory phrases not found verbatim")
+    forbidden_hits: List[PhraseMatch] = Field(default_factory=list)
+    hard_fail: bool = Field(False, description="True if a mandatory phrase is missing or a forbidden topic appears verbatim")
+
 # --- Gear 3: Content Metrics Output ---
 class ContentMetrics(BaseModel):
     """Structured output from the Content Analyzer Agent"""
@@ -18,6 +32,22 @@ class ContentMetrics(BaseModel):
         default_factory=list, 
         description="Specific sentences from the transcript that violate Forbidden Topics or compliance rules."
     )
+    # Filled locally by the compliance scanner, not by the LLM
+    compliance_scan: Optional[ComplianceScan] = Field(None, description="Deterministic phrase scan results.")
+
+# Response schema for JSON mode: the ContentMetrics fields the model fills in
+# (compliance_scan is attached locally). hook_strength's pattern becomes an enum here.
+CONTENT_METRICS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tone_score": {"type": "integer"},
+        "hook_strength": {"type": "string", "enum": ["High", "Medium", "Low"]},
+        "key_themes": {"type": "array", "items": {"type": "string"}},
+        "rate_check": {"type": "string"},
+        "deviation_summary": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["tone_score", "hook_strength", "key_themes", "rate_check", "deviation_summary"],
+}
 
 # --- Gear 2: Influencer Persona Tags ---
 class InfluencerTag(str, Enum):
@@ -44,6 +74,7 @@ class BrandPolicy(BaseModel):
     """
     policy_id: str
     name: str
+    brand: Optional[str] = Field(None, description="Owning brand; windows may overlap across brands, not within one.")
     start_date: date
     end_date: Optional[date]
     market_trigger: str
@@ -80,6 +111,33 @@ class PerformanceMetrics(BaseModel):
         if self.raw_lead_count == 0: return 0.0
         return round(self.closed_count / self.raw_lead_count, 3)
 
+class GroupedMetrics(BaseModel):
+    """
+    Columnar per-group breakdown (by date, influencer ID, campaign, ...).
+    All lists are aligned: index i of every list describes keys[i].
+    """
+    group_by: str = Field(..., description="The CSV column the rows were grouped on")
+    keys: List[str] = Field(default_factory=list)
+    raw_lead_count: List[int] = Field(default_factory=list)
+    lost_leads: List[int] = Field(default_factory=list)
+    closed_count: List[int] = Field(default_factory=list)
+    qualified_lead_count: List[int] = Field(default_factory=list)
+    win_rate: List[float] = Field(default_factory=list)
+
+    def totals(self) -> PerformanceMetrics:
+        """Collapses the breakdown back into the scalar metrics."""
+        return PerformanceMetrics(
+            raw_lead_count=sum(self.raw_lead_count),
+            lost_leads=sum(self.lost_leads),
+            closed_count=sum(self.closed_count)
+        )
+
+# --- Fast Mode: Single-Call Output ---
+class CombinedReview(BaseModel):
+    """Analyzer + coordinator output from one structured generation (fast mode)."""
+    content_analysis: ContentMetrics
+    strategic_review: str = Field(..., description="The final Strategic Review text")
+
 # --- The Central State (The Multi-Agent Contract) ---
 class AgentState(BaseModel):
     """The central state object passed between all agents."""
@@ -96,5 +154,11 @@ class AgentState(BaseModel):
     # ... (Rest of the fields) ...
     content_analysis: Optional[ContentMetrics] = None
     performance_data: Optional[PerformanceMetrics] = None
+    performance_breakdown: Optional[GroupedMetrics] = Field(None, description="Optional per-group metrics (grouped mode).")
     final_strategic_review: Optional[str] = None
-    errors: List[str] = Field(default_factory=list)
\ No newline at end of file
+    errors: List[str] = Field(default_factory=list)
+    input_hash: Optional[str] = Field(None, description="Fingerprint of the run's inputs (results store / dedup key).")
+    pipeline_mode: str = Field("standard", description="standard, fast, or fast_fallback (fast output failed validation).")
+    timings: Optional[Dict[str, float]] = Field(None, description="Per-stage latency breakdown in seconds (when METRICS_ENABLED).")
+    stage_fingerprints: Dict[str, str] = Field(default_factory=dict, description="Input fingerprint per stage (content, metrics, review) on incremental runs.")
+    reused_stages: List[str] = Field(default_factory=list, description="Stages whose output was reused because their inputs were unchanged.")
\ No newline at end of file
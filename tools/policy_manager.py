@@ -1,14 +1,59 @@
 import json
-from datetime import datetime, date
-from typing import List, Optional
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from pydantic import BaseModel
-# Note: The BrandPolicy definition is moved to tools/models.py, 
+# Note: The BrandPolicy definition is moved to tools/models.py,
 # but the manager uses it.
 
+DateLike = Union[str, date]
+# One brand's policies sorted by start_date, and those start dates (the bisect keys)
+BrandIndex = Tuple[List[BaseModel], List[date]]
+_EMPTY_INDEX: BrandIndex = ([], [])
+
+
+class PolicyOverlapError(ValueError):
+    """Raised when two policy windows cover the same date."""
+
+
 class PolicyManager:
-    def __init__(self, filepath="policies.json"):
+    """
+    Interval index over the policy history.
+
+    Policies are grouped by brand and kept sorted by start_date, so a lookup is
+    a single bisect instead of a linear scan. Windows may overlap across brands
+    but not within one; policies without a brand form their own group (the
+    default for lookups). The backing file is re-checked (by mtime) at
+    most once every `reload_interval` seconds, so edits to policies.json are
+    picked up without a restart and without re-reading the file per request.
+    With several worker processes the file is the shared state: each worker
+    keeps its own (small, read-only) index and converges on the same edit
+    within `reload_interval`.
+    """
+
+    def __init__(self, filepath="policies.json", reload_interval: float = 1.0):
         self.filepath = filepath
-        self.policies = self._load_policies()
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._file_stamp: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+        # (all policies, per-brand index) swapped in as one tuple so readers never see a half-built index
+        self._index: Tuple[List[BaseModel], Dict[Optional[str], BrandIndex]] = ([], {})
+        self._reload(force=True)
+
+    @property
+    def policies(self) -> List[BaseModel]:
+        return self._index[0]
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
 
     def _load_policies(self) -> List[BaseModel]: # Use BaseModel to avoid circular dependency
         """Loads and validates the JSON history."""
@@ -19,21 +64,86 @@ class PolicyManager:
             # Sort by date to ensure chronological order
             policies = [BrandPolicy(**p) for p in data]
             policies.sort(key=lambda x: x.start_date)
+            for brand_policies in self._by_brand(policies).values():
+                self._check_overlaps(brand_policies)
             return policies
         except FileNotFoundError:
             return []
 
-    def get_policy_for_date(self, target_date_str: str) -> Optional[BaseModel]:
+    @staticmethod
+    def _by_brand(policies: List[BaseModel]) -> Dict[Optional[str], List[BaseModel]]:
+        grouped: Dict[Optional[str], List[BaseModel]] = {}
+        for policy in policies:
+            grouped.setdefault(policy.brand, []).append(policy)
+        return grouped
+
+    @staticmethod
+    def _check_overlaps(policies: List[BaseModel]) -> None:
+        """One brand's windows must be disjoint, otherwise a date would map to more than one of its policies."""
+        for prev, cur in zip(policies, policies[1:]):
+            if prev.end_date is None or prev.end_date >= cur.start_date:
+                raise PolicyOverlapError(
+                    f"Policy windows overlap: {prev.policy_id} "
+                    f"({prev.start_date} - {prev.end_date or 'open'}) and "
+                    f"{cur.policy_id} (starts {cur.start_date})"
+                )
+
+    def _reload(self, force: bool = False) -> None:
+        with self._lock:
+            stamp = self._stat()
+            if not force and stamp == self._file_stamp:
+                return
+            try:
+                policies = self._load_policies()
+            except Exception as e:
+                # Keep serving the last good index (empty on a first load) if the file is broken;
+                # the next edit is picked up as usual, so a fix doesn't need a restart either
+                print(f"   [POLICY] ⚠️  Loading {self.filepath} failed, keeping previous policies: {e}")
+                self._file_stamp = stamp
+                return
+            by_brand = {
+                brand: (brand_policies, [p.start_date for p in brand_policies])
+                for brand, brand_policies in self._by_brand(policies).items()
+            }
+            self._index = (policies, by_brand)
+            self._file_stamp = stamp
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        if self._stat() != self._file_stamp:
+            self._reload()
+
+    @staticmethod
+    def _to_date(value: DateLike) -> date:
+        if isinstance(value, date):
+            return value
+        return date.fromisoformat(value)
+
+    @staticmethod
+    def _lookup(index: BrandIndex, target: date) -> Optional[BaseModel]:
+        policies, starts = index
+        # Rightmost policy starting on or before the target; windows are disjoint so it is the only candidate
+        i = bisect_right(starts, target) - 1
+        if i < 0:
+            return None
+        policy = policies[i]
+        if policy.end_date is None or policy.end_date >= target:
+            return policy
+        return None
+
+    def get_policy_for_date(self, target_date_str: DateLike, brand: Optional[str] = None) -> Optional[BaseModel]:
         """
         The Time Machine: Returns the rules active on a specific date.
-        Input format: 'YYYY-MM-DD'
+        Input format: 'YYYY-MM-DD' (a date object is also accepted)
         """
-        target = datetime.strptime(target_date_str, "%Y-%m-%d").date()
-        
-        for policy in self.policies:
-            # Check start date
-            if policy.start_date <= target:
-                # Check end date (if it exists)
-                if policy.end_date is None or policy.end_date >= target:
-                    return policy
-        return None
\ No newline at end of file
+        self._maybe_reload()
+        return self._lookup(self._index[1].get(brand, _EMPTY_INDEX), self._to_date(target_date_str))
+
+    def get_policies_for_dates(self, target_dates: Iterable[DateLike], brand: Optional[str] = None) -> List[Optional[BaseModel]]:
+        """Bulk lookup against a single snapshot of the index. Results keep the input order."""
+        self._maybe_reload()
+        index = self._index[1].get(brand, _EMPTY_INDEX)
+        return [self._lookup(index, self._to_date(d)) for d in target_dates]
@@ -0,0 +1,287 @@
+import asyncio
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class MemoryTier:
+    """
+    In-process LRU with a per-entry TTL. Values are deep-copied in and out, so a caller
+    mutating what it stored or got back (e.g. merging a scan into an analysis) can't
+    change the cached entry.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        if expires_at is None:
+            expires_at = time.time() + self.ttl_seconds
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteTier:
+    """
+    On-disk tier so cached analyses survive restarts. Values are stored as JSON.
+    The file can be shared by several worker processes: WAL mode plus a busy timeout keep
+    concurrent readers/writers from failing, and leases mark keys another process is computing.
+    """
+
+    def __init__(self, path: str, namespace: str = "default", ttl_seconds: float = 86400.0):
+        self.path = path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key));
+            CREATE TABLE IF NOT EXISTS response_cache_leases (
+                namespace TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key));
+            """
+        )
+        self._conn.commit()
+
+    def claim(self, key: str, owner: str, lease_seconds: float) -> bool:
+        """Takes the lease on `key` unless another owner holds an unexpired one."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO response_cache_leases (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                " WHERE response_cache_leases.expires_at < ? OR response_cache_leases.owner = excluded.owner",
+                (self.namespace, key, owner, now + lease_seconds, now),
+            )
+            self._conn.commit()
+            return cur.rowcount == 1
+
+    def release(self, key: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM response_cache_leases WHERE namespace = ? AND key = ? AND owner = ?",
+                (self.namespace, key, owner),
+            )
+            self._conn.commit()
+
+    def lease_held(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM response_cache_leases WHERE namespace = ? AND key = ? AND expires_at >= ?",
+                (self.namespace, key, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute(
+                    "DELETE FROM response_cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+                )
+                self._conn.commit()
+                return None
+        return row[1], json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), time.time() + self.ttl_seconds),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+
+def _shared_sqlite_path() -> Optional[str]:
+    """
+    With several workers (WEB_CONCURRENCY > 1) the disk tier defaults to a file under
+    SHARED_STATE_DIR, so every worker sees the others' analyses instead of each paying
+    for its own cold cache.
+    """
+    if int(os.getenv("WEB_CONCURRENCY", "1")) <= 1:
+        return None
+    state_dir = os.getenv("SHARED_STATE_DIR", "/tmp/agent-shared-state")
+    os.makedirs(state_dir, exist_ok=True)
+    return os.path.join(state_dir, "response_cache.db")
+
+
+class ResponseCache:
+    """
+    Two-tier content-addressed cache: memory LRU in front of an optional SQLite file.
+    Any object with the same get/set methods can be passed to the agents instead.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "default",
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        sqlite_path: Optional[str] = None,
+        disk_ttl_seconds: float = 86400.0,
+        lease_seconds: float = 120.0,
+    ):
+        self.namespace = namespace
+        self.lease_seconds = lease_seconds
+        self._owner = f"{os.getpid()}:{id(self)}"
+        self.memory = MemoryTier(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.disk = SQLiteTier(sqlite_path, namespace=namespace, ttl_seconds=disk_ttl_seconds) if sqlite_path else None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @classmethod
+    def from_env(cls, namespace: str) -> "ResponseCache":
+        """Builds a cache from RESPONSE_CACHE_* environment variables."""
+        return cls(
+            namespace=namespace,
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+            sqlite_path=os.getenv("RESPONSE_CACHE_SQLITE_PATH") or _shared_sqlite_path(),
+            disk_ttl_seconds=float(os.getenv("RESPONSE_CACHE_DISK_TTL_SECONDS", "86400")),
+            lease_seconds=float(os.getenv("RESPONSE_CACHE_LEASE_SECONDS", "120")),
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.disk is not None:
+            item = self.disk.get(key)
+            if item is not None:
+                expires_at, value = item
+                # Promote to memory, but never past the disk entry's own expiry
+                self.memory.set(key, value, expires_at=min(expires_at, time.time() + self.memory.ttl_seconds))
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """get() for event-loop callers: a SQLite read (busy timeout up to 30s) goes to a thread."""
+        if self.disk is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def set_async(self, key: str, value: Any) -> None:
+        if self.disk is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    # --- Cross-process coordination (only meaningful with a shared SQLite tier) ---
+
+    @property
+    def shared(self) -> bool:
+        """True when leases mean anything, i.e. there is a SQLite tier other processes can see."""
+        return self.disk is not None
+
+    def claim(self, key: str) -> bool:
+        """
+        True if this process should compute the value for `key`. False means another worker
+        holds the lease and is computing it right now; wait_for()/wait_for_async() instead.
+        """
+        if self.disk is None:
+            return True
+        return self.disk.claim(key, self._owner, self.lease_seconds)
+
+    def release(self, key: str) -> None:
+        if self.disk is not None:
+            self.disk.release(key, self._owner)
+
+    def _poll(self, key: str) -> Tuple[bool, Optional[Any]]:
+        """(done, value): done once the value landed or the other worker gave up its lease."""
+        item = self.disk.get(key)
+        if item is not None:
+            expires_at, value = item
+            self.memory.set(key, value, expires_at=min(expires_at, time.time() + self.memory.ttl_seconds))
+            self.hits += 1
+            self.disk_hits += 1
+            return True, value
+        return not self.disk.lease_held(key), None
+
+    def wait_for(self, key: str, timeout: float, interval: float = 0.25) -> Optional[Any]:
+        """Blocks until another worker's value for `key` appears (None on timeout or if it gave up)."""
+        if self.disk is None:
+            return None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            done, value = self._poll(key)
+            if done:
+                return value
+            time.sleep(interval)
+        return None
+
+    async def wait_for_async(self, key: str, timeout: float, interval: float = 0.25) -> Optional[Any]:
+        if self.disk is None:
+            return None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            done, value = await asyncio.to_thread(self._poll, key)
+            if done:
+                return value
+            await asyncio.sleep(interval)
+        return None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+from tools.fingerprint import stable_hash
+from tools.models import AgentState
+
+
+def compute_input_hash(approved_script: str, influencer_transcript: str, csv_digest: str, campaign_date: str, influencer_data: dict, group_by: Optional[str] = None, mode: str = "standard", policy_data: Optional[dict] = None, brand: Optional[str] = None) -> str:
+    """
+    Identity of a run's inputs. The CSV contributes its sha256 (see tools.fingerprint)
+    rather than its text, so streamed uploads hash the same as in-memory ones. The active
+    policy is included, so a hot-reloaded policies.json never serves results from the old rules.
+    """
+    parts = [approved_script, influencer_transcript, csv_digest, campaign_date, influencer_data, group_by or "", policy_data]
+    if mode != "standard":
+        # Fast-mode output differs from the two-stage pipeline, so it gets its own identity
+        parts.append(mode)
+    if brand is not None:
+        # Unbranded runs keep the identity they had before brands existed
+        parts.append(f"brand:{brand}")
+    return stable_hash(*parts)
+
+
+class ResultsStore:
+    """
+    SQLite archive of completed AgentState runs, indexed for the queries the dashboard makes.
+    Writes go through a single background thread so they never sit on the request path.
+    """
+
+    def __init__(self, path: str = "results.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        # The timeout covers other worker processes holding the write lock (multi-worker deployments)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        # WAL lets readers proceed while the writer thread appends
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS agent_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                input_hash TEXT NOT NULL,
+                influencer_id TEXT NOT NULL,
+                policy_id TEXT,
+                campaign_date TEXT NOT NULL,
+                has_errors INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                state_json TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_runs_input_hash ON agent_runs (input_hash, created_at);
+            CREATE INDEX IF NOT EXISTS idx_runs_influencer ON agent_runs (influencer_id, campaign_date);
+            CREATE INDEX IF NOT EXISTS idx_runs_policy ON agent_runs (policy_id, campaign_date);
+            CREATE INDEX IF NOT EXISTS idx_runs_campaign_date ON agent_runs (campaign_date);
+            """
+        )
+        self._conn.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="results-store")
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultsStore"]:
+        """None when RESULTS_STORE_ENABLED is false; otherwise a store at RESULTS_DB_PATH."""
+        if os.getenv("RESULTS_STORE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(os.getenv("RESULTS_DB_PATH", "results.db"))
+
+    def save(self, state: AgentState) -> None:
+        if not state.input_hash:
+            return
+        row = (
+            state.input_hash,
+            state.influencer_profile.id,
+            state.brand_policy.policy_id if state.brand_policy else None,
+            state.campaign_date.isoformat(),
+            1 if state.errors else 0,
+            time.time(),
+            state.model_dump_json(),
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO agent_runs (input_hash, influencer_id, policy_id, campaign_date, has_errors, created_at, state_json)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self._conn.commit()
+
+    def save_in_background(self, state: AgentState) -> Future:
+        """Fire-and-forget write; the state is copied so later mutations don't leak in."""
+        snapshot = state.model_copy(deep=True)
+        future = self._writer.submit(self.save, snapshot)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        if future.exception() is not None:
+            print(f"   [STORE] ⚠️  Failed to persist result: {future.exception()}")
+
+    def get_by_input_hash(self, input_hash: str, successful_only: bool = True) -> Optional[AgentState]:
+        """Most recent run for these exact inputs (error-free runs only, by default)."""
+        sql = "SELECT state_json FROM agent_runs WHERE input_hash = ?"
+        if successful_only:
+            sql += " AND has_errors = 0"
+        sql += " ORDER BY created_at DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(sql, (input_hash,)).fetchone()
+        return AgentState.model_validate_json(row[0]) if row else None
+
+    def query(
+        self,
+        influencer_id: Optional[str] = None,
+        policy_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> List[dict]:
+        """Paginated listing, newest campaign first. Dates are ISO strings (inclusive bounds)."""
+        clauses, params = [], []
+        if influencer_id is not None:
+            clauses.append("influencer_id = ?")
+            params.append(influencer_id)
+        if policy_id is not None:
+            clauses.append("policy_id = ?")
+            params.append(policy_id)
+        if date_from is not None:
+            clauses.append("campaign_date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            clauses.append("campaign_date <= ?")
+            params.append(date_to)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (
+            "SELECT id, input_hash, created_at, state_json FROM agent_runs"
+            f"{where} ORDER BY campaign_date DESC, id DESC LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit, offset)).fetchall()
+        return [
+            {
+                "id": row[0],
+                "input_hash": row[1],
+                "created_at": row[2],
+                "state": AgentState.model_validate_json(row[3]),
+            }
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()